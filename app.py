@@ -1,22 +1,30 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, Request, render_template, request, jsonify, session, redirect, url_for, g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_cors import CORS
-from flask_mail import Mail, Message
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
+import click
+import codecs
+import hashlib
 import os
-from google import genai
-from google.genai import types
-import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 import json
 import re
 import secrets
+import threading
 import time
+import unicodedata
+import zlib
 from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects import postgresql, sqlite
+import sqlite3
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -35,11 +43,31 @@ if not DATABASE_URL:
 elif DATABASE_URL.startswith('postgres://'):
     # Corrigir URL do Heroku (postgres:// -> postgresql://)
     DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+IS_POSTGRES = DATABASE_URL.startswith('postgresql')
+
+# Réplica de leitura opcional (rotas GET marcadas com @read_only)
+DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL', '').strip()
+if DATABASE_REPLICA_URL.startswith('postgres://'):
+    DATABASE_REPLICA_URL = DATABASE_REPLICA_URL.replace('postgres://', 'postgresql://', 1)
+REPLICA_STICKY_SECONDS = float(os.getenv('REPLICA_STICKY_SECONDS', 5))  # leituras no primário após uma escrita
 
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+if DATABASE_REPLICA_URL:
+    app.config['SQLALCHEMY_BINDS'] = {'replica': DATABASE_REPLICA_URL}
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'chave-padrao-desenvolver-apenas')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
+IMPORT_MAX_BYTES = int(os.getenv('IMPORT_MAX_MB', 512)) * 1024 * 1024  # limite só de /api/import/notes
+
+class AppRequest(Request):
+    """A importação de notas lê o arquivo em streaming, então aceita uploads bem maiores"""
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'import_notes':
+            return IMPORT_MAX_BYTES
+        return super().max_content_length
+
+app.request_class = AppRequest
 
 # Configuração Flask-Mail
 app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
@@ -49,8 +77,6 @@ app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME', '')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD', '')
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_USERNAME', 'noreply@bnstudy.com')
 
-mail = Mail(app)
-
 # CORS configurado
 frontend_origins = ["http://localhost:5000", "http://127.0.0.1:5000"]
 extra_origin = os.getenv('FRONTEND_ORIGIN', '').strip()
@@ -75,12 +101,53 @@ limiter = Limiter(
 
 # Configuração Google Gemini (GRATUITO!)
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
-if GEMINI_API_KEY:
-    client = genai.Client(api_key=GEMINI_API_KEY)
-else:
-    client = None
 
-db = SQLAlchemy(app)
+class RoutingSession(FlaskSQLAlchemySession):
+    """Envia as consultas das rotas @read_only para a réplica; escritas sempre no primário"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing
+                and not isinstance(clause, db.sql.expression.UpdateBase)
+                and has_app_context() and g.get('use_replica')):
+            return self._db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+
+# SQLite só aplica ON DELETE CASCADE com foreign_keys ligado em cada conexão
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+# Serviços pesados (Gemini, SMTP) são importados e criados só no primeiro uso,
+# já dentro do worker. Assim o import do app fica leve e o gunicorn --preload
+# não compartilha conexões entre processos.
+_lazy_lock = threading.Lock()
+_ai_client = None
+_mail = None
+
+def get_ai_client():
+    """Retorna o cliente do Gemini, criando-o na primeira chamada (None se sem API key)"""
+    global _ai_client
+    if _ai_client is None and GEMINI_API_KEY:
+        with _lazy_lock:
+            if _ai_client is None:
+                from google import genai
+                _ai_client = genai.Client(api_key=GEMINI_API_KEY)
+    return _ai_client
+
+def get_mail():
+    """Retorna a extensão Flask-Mail, inicializando-a na primeira chamada"""
+    global _mail
+    if _mail is None:
+        with _lazy_lock:
+            if _mail is None:
+                from flask_mail import Mail
+                _mail = Mail(app)
+    return _mail
 
 # Funções auxiliares
 def validate_email(email):
@@ -98,6 +165,32 @@ def generate_reset_token():
     """Gera token seguro para reset de senha"""
     return secrets.token_urlsafe(32)
 
+# Dias da rotina na mesma ordem de datetime.weekday() (segunda = 0)
+ROUTINE_DAYS = ['segunda', 'terça', 'quarta', 'quinta', 'sexta', 'sábado', 'domingo']
+ALL_DAYS_MASK = (1 << len(ROUTINE_DAYS)) - 1
+
+def encode_days(days):
+    """Converte lista ou string 'segunda,terça,...' em máscara de 7 bits"""
+    if isinstance(days, str):
+        days = days.split(',')
+    mask = 0
+    for day in days:
+        day = day.strip().lower()
+        if day in ROUTINE_DAYS:
+            mask |= 1 << ROUTINE_DAYS.index(day)
+    return mask
+
+def decode_days(mask):
+    """Converte máscara de 7 bits na lista de dias"""
+    return [day for i, day in enumerate(ROUTINE_DAYS) if mask & (1 << i)]
+
+def routine_date_for_day(day=None):
+    """Data (semana atual) correspondente ao dia da rotina; hoje se não informado"""
+    today = datetime.now().date()
+    if day not in ROUTINE_DAYS:
+        return today
+    return today + timedelta(days=ROUTINE_DAYS.index(day) - today.weekday())
+
 # Modelos do Banco de Dados
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -108,43 +201,150 @@ class User(db.Model):
     reset_token = db.Column(db.String(100), nullable=True)
     reset_token_expires = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    folders = db.relationship('Folder', backref='user', lazy=True, cascade='all, delete-orphan')
+    revision = db.Column(db.BigInteger, nullable=False, default=0)  # contador usado como cursor do /api/sync
+    tombstones_pruned_until = db.Column(db.BigInteger, nullable=False, default=0)  # cursores abaixo disso: sync completo
+    deletion_requested_at = db.Column(db.DateTime, nullable=True)  # exclusão em andamento (segundo plano)
+    folders = db.relationship('Folder', backref='user', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
 
 class Folder(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    notes = db.relationship('Note', backref='folder', lazy=True, cascade='all, delete-orphan')
+    revision = db.Column(db.BigInteger, nullable=False, default=0)
+    notes = db.relationship('Note', backref='folder', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_folder_user_revision', 'user_id', 'revision'),
+    )
 
 class Note(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=True)
-    folder_id = db.Column(db.Integer, db.ForeignKey('folder.id'), nullable=False)
+    folder_id = db.Column(db.Integer, db.ForeignKey('folder.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    revision = db.Column(db.BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_note_folder_revision', 'folder_id', 'revision'),
+    )
+
+class NoteVector(db.Model):
+    """Termos de uma nota (hash crc32 + contagem) para o índice de notas relacionadas"""
+    note_id = db.Column(db.Integer, db.ForeignKey('note.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    revision = db.Column(db.BigInteger, nullable=False, default=0)  # Note.revision quando foi calculado
+    terms = db.Column(db.LargeBinary, nullable=False)  # uint32[n] termos + uint16[n] contagens
 
 class StudySession(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False)
+    """Log de sessões; no PostgreSQL é particionado por mês em start_time"""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    # No PostgreSQL a chave de partição precisa fazer parte da chave primária
+    start_time = db.Column(db.DateTime, nullable=False, primary_key=IS_POSTGRES)
     end_time = db.Column(db.DateTime, nullable=True)
     duration_seconds = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_study_session_user_start', 'user_id', 'start_time'),
+        {'postgresql_partition_by': 'RANGE (start_time)'} if IS_POSTGRES else {},
+    )
+
+class StudyDailySummary(db.Model):
+    """Totais diários dos períodos de StudySession já arquivados"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    sessions = db.Column(db.Integer, nullable=False, default=0)
+    seconds = db.Column(db.BigInteger, nullable=False, default=0)
+
 class RoutineTask(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     category = db.Column(db.String(50), nullable=False)  # estudo, trabalho, academia, lazer, etc
     start_time = db.Column(db.String(5), nullable=False)  # HH:MM
     end_time = db.Column(db.String(5), nullable=False)    # HH:MM
-    days = db.Column(db.String(50), nullable=False)  # segunda,terça,quarta...
+    days_mask = db.Column(db.SmallInteger, nullable=False, default=ALL_DAYS_MASK)  # bit 0 = segunda ... bit 6 = domingo
     color = db.Column(db.String(7), default='#6366f1')
-    completed = db.Column(db.Boolean, default=False)
-    order_index = db.Column(db.Integer, default=0)
+    order_index = db.Column(db.Integer, default=0)  # chaves espaçadas (ROUTINE_ORDER_GAP)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    revision = db.Column(db.BigInteger, nullable=False, default=0)
+    completions = db.relationship('RoutineCompletion', backref='task', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_routine_task_user_days', 'user_id', 'days_mask'),
+        db.Index('ix_routine_task_user_revision', 'user_id', 'revision'),
+        db.Index('ix_routine_task_user_order', 'user_id', 'order_index'),
+    )
+
+class RoutineCompletion(db.Model):
+    """Marca de conclusão de uma tarefa em uma data específica"""
+    task_id = db.Column(db.Integer, db.ForeignKey('routine_task.id', ondelete='CASCADE'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+
+class SyncTombstone(db.Model):
+    """Registro de exclusão para o /api/sync avisar o cliente"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    entity = db.Column(db.String(20), nullable=False)  # folder, note ou routine_task
+    entity_id = db.Column(db.Integer, nullable=False)
+    revision = db.Column(db.BigInteger, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_sync_tombstone_user_revision', 'user_id', 'revision'),
+    )
+
+class ChatMessage(db.Model):
+    """Mensagens da conversa com o assistente (histórico recente verbatim)"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    role = db.Column(db.String(10), nullable=False)  # user ou assistant
+    content = db.Column(db.Text, nullable=False)
+    tokens = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ChatMemory(db.Model):
+    """Resumo acumulado das mensagens antigas de cada usuário"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    summary = db.Column(db.Text, nullable=False, default='')
+    summary_tokens = db.Column(db.Integer, nullable=False, default=0)
+    summarized_until = db.Column(db.Integer, nullable=False, default=0)  # último ChatMessage.id já resumido
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class AISummaryCache(db.Model):
+    """Resumos do Gemini reaproveitáveis, indexados pelo hash do conteúdo resumido"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    content_hash = db.Column(db.String(64), primary_key=True)  # sha256 da parte (ou do guia)
+    summary = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class PlatformDailyStats(db.Model):
+    """Agregados globais por dia (UTC), atualizados a cada escrita"""
+    date = db.Column(db.Date, primary_key=True)
+    active_users = db.Column(db.Integer, nullable=False, default=0)
+    new_users = db.Column(db.Integer, nullable=False, default=0)
+    study_sessions = db.Column(db.Integer, nullable=False, default=0)
+    study_seconds = db.Column(db.BigInteger, nullable=False, default=0)
+    notes_created = db.Column(db.Integer, nullable=False, default=0)
+
+class DailyActiveUser(db.Model):
+    """Usuários ativos por dia (para contar cada usuário uma única vez)"""
+    date = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+
+class PlatformCounter(db.Model):
+    """Totais globais mantidos a cada escrita (ex.: users = contas existentes)"""
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+def account_active(user_id):
+    """False se a conta já foi apagada ou está com a exclusão em andamento"""
+    row = db.session.query(User.deletion_requested_at).filter_by(id=user_id).first()
+    return row is not None and row[0] is None
 
 # Decorator para proteger rotas
 def login_required(f):
@@ -152,9 +352,158 @@ def login_required(f):
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             return redirect(url_for('login_page'))
+        # Sessão de uma conta excluída: as escritas disputariam com o purge_user em lotes
+        if request.method in ('POST', 'PUT', 'DELETE') and not account_active(session['user_id']):
+            session.clear()
+            return jsonify({'error': 'Conta excluída. Faça login novamente.'}), 401
         return f(*args, **kwargs)
     return decorated_function
 
+# Decorator para rotas somente leitura (podem usar a réplica)
+def read_only(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        # Logo após uma escrita do usuário, ler do primário (read-your-writes)
+        recently_wrote = time.time() - session.get('last_write_at', 0) < REPLICA_STICKY_SECONDS
+        g.use_replica = 'replica' in db.engines and not recently_wrote
+        return f(*args, **kwargs)
+    return decorated_function
+
+def read_from_primary():
+    """A réplica ainda não tem a linha (atraso de replicação): o resto da requisição lê do primário"""
+    if not g.get('use_replica'):
+        return False
+    g.use_replica = False
+    return True
+
+@app.after_request
+def remember_last_write(response):
+    if ('replica' in db.engines and request.method in ('POST', 'PUT', 'DELETE')
+            and response.status_code < 400 and 'user_id' in session):
+        session['last_write_at'] = time.time()
+    return response
+
+# ===== CONTROLE DE ADMISSÃO POR CLASSE DE ENDPOINT =====
+# Rotas lentas (Gemini, SMTP, exportações) disputam as mesmas threads do worker que o CRUD.
+# Cada classe tem um teto de requisições simultâneas e uma fila curta; quem não entra a
+# tempo recebe 503 + Retry-After, e as threads restantes continuam livres para o CRUD.
+class AdmissionClass:
+    """Semáforo com fila limitada e prazo de espera (por processo)"""
+
+    def __init__(self, name, limit, queue_size, max_wait):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed_full = 0
+        self.shed_timeout = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+                return True
+            if self.waiting >= self.queue_size:
+                self.shed_full += 1
+                return False
+            self.waiting += 1
+            deadline = time.monotonic() + self.max_wait
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed_timeout += 1
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def retry_after(self):
+        return max(1, int(self.max_wait) * 2)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'limit': self.limit,
+                'queue_size': self.queue_size,
+                'max_wait': self.max_wait,
+                'active': self.active,
+                'queued': self.waiting,
+                'admitted': self.admitted,
+                'shed': self.shed_full + self.shed_timeout,
+                'shed_queue_full': self.shed_full,
+                'shed_timeout': self.shed_timeout
+            }
+
+def admission_class_from_env(name, limit, queue_size, max_wait):
+    prefix = f'ADMISSION_{name.upper()}'
+    return AdmissionClass(
+        name,
+        int(os.getenv(f'{prefix}_LIMIT', limit)),
+        int(os.getenv(f'{prefix}_QUEUE', queue_size)),
+        float(os.getenv(f'{prefix}_MAX_WAIT', max_wait))
+    )
+
+WEB_THREADS = max(int(os.getenv('WEB_THREADS', 16)), 1)  # --threads do gunicorn (por worker)
+ADMISSION_CRUD_RESERVE = int(os.getenv('ADMISSION_CRUD_RESERVE', 6))  # threads que as rotas lentas nunca ocupam
+
+admission_classes = {
+    'chat': admission_class_from_env('chat', limit=4, queue_size=2, max_wait=5),
+    'mail': admission_class_from_env('mail', limit=1, queue_size=0, max_wait=3),
+    'export': admission_class_from_env('export', limit=1, queue_size=0, max_wait=5),
+    'summary': admission_class_from_env('summary', limit=1, queue_size=0, max_wait=2)
+}
+
+def check_admission_budget(classes, threads, reserve):
+    """Quem espera na fila também segura uma thread do worker: limites + filas das classes
+    lentas precisam caber em `threads - reserve`, senão um pico tira as threads do CRUD"""
+    used = sum(c.limit + c.queue_size for c in classes.values())
+    if used > threads - reserve:
+        raise RuntimeError(
+            f"Controle de admissão: limites + filas somam {used} threads, mas só há {threads - reserve} "
+            f"(WEB_THREADS={threads} - ADMISSION_CRUD_RESERVE={reserve}). "
+            f"Reduza ADMISSION_*_LIMIT/_QUEUE ou aumente WEB_THREADS."
+        )
+    return used
+
+check_admission_budget(admission_classes, WEB_THREADS, ADMISSION_CRUD_RESERVE)
+
+def admission(class_name):
+    """Decorator: só executa a rota se houver vaga na classe; senão 503 rápido"""
+    admission_class = admission_classes[class_name]
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not admission_class.acquire():
+                print(f"🚦 Requisição descartada ({class_name}): {request.path}")
+                response = jsonify({
+                    'error': 'Servidor ocupado. Tente novamente em alguns segundos.',
+                    'retry_after': admission_class.retry_after()
+                })
+                response.status_code = 503
+                response.headers['Retry-After'] = str(admission_class.retry_after())
+                return response
+            try:
+                return f(*args, **kwargs)
+            finally:
+                admission_class.release()
+        return decorated_function
+    return decorator
+
 # Decorator para proteger rotas de admin
 def admin_required(f):
     @wraps(f)
@@ -162,14 +511,566 @@ def admin_required(f):
         if 'user_id' not in session:
             return redirect(url_for('login_page'))
         user = User.query.get(session['user_id'])
-        if not user or not user.is_admin:
+        if not user or user.deletion_requested_at or not user.is_admin:
             return jsonify({'error': 'Acesso negado. Apenas administradores.'}), 403
         return f(*args, **kwargs)
     return decorated_function
 
-# Criar tabelas
-with app.app_context():
+# Criar tabelas (comando explícito, fora do import: flask --app app init-db)
+@app.cli.command('init-db')
+def init_db_command():
+    """Cria as tabelas que ainda não existem e migra as que vieram de versões anteriores"""
     db.create_all()
+    migrate_schema()
+    ensure_study_partitions()
+    ensure_platform_counters()
+    print("✅ Tabelas criadas/verificadas com sucesso!")
+
+# ===== MIGRAÇÃO DO ESQUEMA =====
+# create_all não altera tabelas existentes. Bancos de versões anteriores recebem aqui as
+# colunas novas, o days_mask calculado a partir de routine_task.days e as chaves
+# estrangeiras com ON DELETE CASCADE. Cada passo confere o esquema atual antes de
+# alterar, então rodar de novo não muda nada.
+LEGACY_COLUMNS = {'routine_task': ('days', 'completed')}  # substituídas por days_mask e RoutineCompletion
+
+def column_ddl(column, dialect):
+    """Definição para ADD COLUMN; NOT NULL só quando há um default para as linhas existentes"""
+    ddl = f'{dialect.identifier_preparer.quote(column.name)} {column.type.compile(dialect=dialect)}'
+    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+    if default is not None:
+        ddl += f' DEFAULT {int(default)}' if isinstance(default, (bool, int)) else f" DEFAULT '{default}'"
+        if not column.nullable:
+            ddl += ' NOT NULL'
+    return ddl
+
+def outdated_foreign_keys(inspector, table):
+    """Chaves estrangeiras do modelo cujo ON DELETE difere do banco: [(ForeignKey, fk atual ou None)]"""
+    current = {
+        tuple(fk['constrained_columns']): fk for fk in inspector.get_foreign_keys(table.name)
+    }
+    outdated = []
+    for fk in table.foreign_keys:
+        existing = current.get((fk.parent.name,))
+        existing_ondelete = ((existing or {}).get('options') or {}).get('ondelete') or ''
+        if existing is None or existing_ondelete.upper() != (fk.ondelete or '').upper():
+            outdated.append((fk, existing))
+    return outdated
+
+def rebuild_sqlite_table(conn, table):
+    """SQLite não altera chaves estrangeiras: recria a tabela e copia as colunas do modelo"""
+    inspector = db.inspect(conn)
+    columns = ', '.join(f'"{c["name"]}"' for c in inspector.get_columns(table.name) if c['name'] in table.c)
+    for index in inspector.get_indexes(table.name):
+        conn.exec_driver_sql(f'DROP INDEX "{index["name"]}"')
+    # legacy_alter_table: as chaves estrangeiras das outras tabelas continuam apontando para o nome original
+    conn.exec_driver_sql('PRAGMA legacy_alter_table=ON')
+    conn.exec_driver_sql(f'ALTER TABLE "{table.name}" RENAME TO "{table.name}_old"')
+    conn.exec_driver_sql('PRAGMA legacy_alter_table=OFF')
+    table.create(conn)
+    conn.exec_driver_sql(f'INSERT INTO "{table.name}" ({columns}) SELECT {columns} FROM "{table.name}_old"')
+    conn.exec_driver_sql(f'DROP TABLE "{table.name}_old"')
+
+def partition_study_sessions(conn):
+    """PostgreSQL: converte um study_session comum (versões anteriores) na tabela particionada"""
+    is_plain = conn.exec_driver_sql(
+        "SELECT 1 FROM pg_class WHERE relname = 'study_session' AND relkind = 'r'"
+    ).scalar()
+    if not is_plain:
+        return
+    for index in db.inspect(conn).get_indexes('study_session'):
+        conn.exec_driver_sql(f'DROP INDEX "{index["name"]}"')
+    conn.exec_driver_sql('ALTER TABLE study_session RENAME TO study_session_unpartitioned')
+    StudySession.__table__.create(conn)
+    oldest = conn.exec_driver_sql('SELECT MIN(start_time) FROM study_session_unpartitioned').scalar()
+    now = datetime.utcnow()
+    period = month_start(oldest or now)
+    while period <= month_start(now, STUDY_PARTITION_MONTHS_AHEAD):
+        conn.exec_driver_sql(study_partition_ddl(period))
+        period = month_start(period, 1)
+    conn.exec_driver_sql(study_partition_ddl(None))
+    columns = ', '.join(c.name for c in StudySession.__table__.columns)
+    conn.exec_driver_sql(f'INSERT INTO study_session ({columns}) SELECT {columns} FROM study_session_unpartitioned')
+    conn.exec_driver_sql(
+        "SELECT setval(pg_get_serial_sequence('study_session', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM study_session"
+    )
+    conn.exec_driver_sql('DROP TABLE study_session_unpartitioned')
+    print("🗂️ study_session convertida em tabela particionada por mês")
+
+def migrate_schema():
+    """Leva um banco de versão anterior ao esquema dos modelos atuais (idempotente)"""
+    with db.engine.connect() as conn:
+        dialect = conn.dialect
+        quote = dialect.identifier_preparer.quote
+        if not IS_POSTGRES:
+            # Precisa vir antes de qualquer transação; a recriação de tabelas exige FKs desligadas
+            conn.exec_driver_sql('PRAGMA foreign_keys=OFF')
+        try:
+            tables = [t for t in db.metadata.sorted_tables if db.inspect(conn).has_table(t.name)]
+            
+            # 1. Colunas novas (revision, deletion_requested_at, days_mask...)
+            for table in tables:
+                existing = {c['name'] for c in db.inspect(conn).get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing and not column.primary_key:
+                        conn.exec_driver_sql(f'ALTER TABLE {quote(table.name)} ADD COLUMN {column_ddl(column, dialect)}')
+                        print(f"➕ {table.name}.{column.name}")
+            
+            # 2. Rotina: days (texto) -> days_mask e completed -> RoutineCompletion de hoje
+            legacy = {c['name'] for c in db.inspect(conn).get_columns('routine_task')} if RoutineTask.__table__ in tables else set()
+            if 'days' in legacy:
+                for (days,) in conn.execute(db.text('SELECT DISTINCT days FROM routine_task')).all():
+                    conn.execute(db.text('UPDATE routine_task SET days_mask = :mask WHERE days = :days'),
+                                 {'mask': encode_days(days or ''), 'days': days})
+            if 'completed' in legacy:
+                conn.execute(db.text(
+                    'INSERT INTO routine_completion (task_id, date) '
+                    'SELECT id, :today FROM routine_task t WHERE t.completed AND NOT EXISTS '
+                    '(SELECT 1 FROM routine_completion c WHERE c.task_id = t.id AND c.date = :today)'
+                ).bindparams(db.bindparam('today', type_=db.Date)), {'today': datetime.now().date()})
+            
+            # 3. Chaves estrangeiras com ON DELETE CASCADE e colunas antigas removidas
+            for table in tables:
+                inspector = db.inspect(conn)
+                outdated = outdated_foreign_keys(inspector, table)
+                leftovers = [c for c in LEGACY_COLUMNS.get(table.name, ()) if c in {col['name'] for col in inspector.get_columns(table.name)}]
+                if not outdated and not leftovers:
+                    continue
+                if not IS_POSTGRES:
+                    rebuild_sqlite_table(conn, table)
+                else:
+                    for fk, existing in outdated:
+                        name = existing['name'] if existing else f'{table.name}_{fk.parent.name}_fkey'
+                        if existing:
+                            conn.exec_driver_sql(f'ALTER TABLE {quote(table.name)} DROP CONSTRAINT {quote(name)}')
+                        conn.exec_driver_sql(
+                            f'ALTER TABLE {quote(table.name)} ADD CONSTRAINT {quote(name)} '
+                            f'FOREIGN KEY ({quote(fk.parent.name)}) REFERENCES {quote(fk.column.table.name)} ({quote(fk.column.name)})'
+                            + (f' ON DELETE {fk.ondelete}' if fk.ondelete else '')
+                        )
+                    for column in leftovers:
+                        conn.exec_driver_sql(f'ALTER TABLE {quote(table.name)} DROP COLUMN {quote(column)}')
+                print(f"🔧 {table.name}: chaves estrangeiras/colunas atualizadas")
+            
+            if IS_POSTGRES:
+                partition_study_sessions(conn)
+            
+            # 4. Índices dos modelos que ainda não existem nas tabelas antigas
+            for table in tables:
+                existing = {index['name'] for index in db.inspect(conn).get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name not in existing:
+                        index.create(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if not IS_POSTGRES:
+                conn.exec_driver_sql('PRAGMA foreign_keys=ON')
+
+# ===== REVISÕES (SINCRONIZAÇÃO INCREMENTAL) =====
+def next_revision(user_id):
+    """Incrementa e retorna a revisão do usuário; cada escrita grava esse número na linha alterada"""
+    return db.session.execute(
+        db.update(User)
+        .where(User.id == user_id)
+        .values(revision=User.revision + 1)
+        .returning(User.revision)
+    ).scalar_one()
+
+def add_tombstones(user_id, entity, entity_ids, revision):
+    db.session.add_all(
+        SyncTombstone(user_id=user_id, entity=entity, entity_id=entity_id, revision=revision)
+        for entity_id in entity_ids
+    )
+
+@app.cli.command('prune-sync-tombstones')
+@click.option('--days', default=30, show_default=True, help='Dias de exclusões mantidos para o /api/sync')
+def prune_sync_tombstones_command(days):
+    """Apaga registros de exclusão antigos; cursores anteriores a eles recebem sincronização completa"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    expired = db.or_(SyncTombstone.created_at < cutoff, SyncTombstone.created_at.is_(None))
+    floors = (
+        db.session.query(SyncTombstone.user_id, db.func.max(SyncTombstone.revision))
+        .filter(expired)
+        .group_by(SyncTombstone.user_id)
+        .all()
+    )
+    if floors:
+        db.session.execute(db.update(User), [
+            {'id': user_id, 'tombstones_pruned_until': revision} for user_id, revision in floors
+        ])
+    removed = SyncTombstone.query.filter(expired).delete(synchronize_session=False)
+    db.session.commit()
+    print(f"✅ {removed} registros de exclusão removidos ({len(floors)} usuários)")
+
+# ===== EXCLUSÃO DE CONTAS =====
+ACCOUNT_DELETE_ASYNC_THRESHOLD = int(os.getenv('ACCOUNT_DELETE_ASYNC_THRESHOLD', 5000))  # linhas
+ACCOUNT_DELETE_CHUNK = 5000
+
+def account_size(user_id):
+    """Quantidade aproximada de linhas da conta (notas + sessões de estudo)"""
+    notes = db.session.query(db.func.count(Note.id)).join(Folder).filter(Folder.user_id == user_id).scalar()
+    sessions = db.session.query(db.func.count(StudySession.id)).filter(StudySession.user_id == user_id).scalar()
+    return (notes or 0) + (sessions or 0)
+
+def delete_where(model, criteria, chunk_size=None):
+    """DELETE por conjunto; com chunk_size, em lotes de ids com commit por lote"""
+    if chunk_size is None or model.__table__.primary_key.columns.keys() != ['id']:
+        return db.session.query(model).filter(criteria).delete(synchronize_session=False)
+    total = 0
+    while True:
+        ids = [row_id for (row_id,) in db.session.query(model.id).filter(criteria).limit(chunk_size)]
+        if not ids:
+            return total
+        total += db.session.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+def purge_user(user_id, chunk_size=None):
+    """Apaga o usuário e todos os seus dados, filhos antes dos pais (sem carregar linhas)"""
+    folder_ids = db.select(Folder.id).where(Folder.user_id == user_id)
+    task_ids = db.select(RoutineTask.id).where(RoutineTask.user_id == user_id)
+    steps = [
+        (NoteVector, NoteVector.user_id == user_id),
+        (RoutineCompletion, RoutineCompletion.task_id.in_(task_ids)),
+        (Note, Note.folder_id.in_(folder_ids)),
+        (Folder, Folder.user_id == user_id),
+        (RoutineTask, RoutineTask.user_id == user_id),
+        (StudySession, StudySession.user_id == user_id),
+        (StudyDailySummary, StudyDailySummary.user_id == user_id),
+        (ChatMessage, ChatMessage.user_id == user_id),
+        (ChatMemory, ChatMemory.user_id == user_id),
+        (AISummaryCache, AISummaryCache.user_id == user_id),
+        (SyncTombstone, SyncTombstone.user_id == user_id),
+    ]
+    for model, criteria in steps:
+        delete_where(model, criteria, chunk_size)
+    
+    # Tabelas de períodos arquivados no SQLite não têm chave estrangeira
+    if not IS_POSTGRES:
+        for table in db.inspect(db.engine).get_table_names():
+            if table.startswith('study_session_'):
+                db.session.execute(db.text(f'DELETE FROM {table} WHERE user_id = :user_id'), {'user_id': user_id})
+    
+    if User.query.filter_by(id=user_id).delete(synchronize_session=False):
+        bump_platform_counter('users', -1)
+    db.session.commit()
+
+def run_account_deletion(user_id):
+    """Exclusão em segundo plano (thread própria, com contexto da aplicação)"""
+    with app.app_context():
+        started = time.monotonic()
+        try:
+            purge_user(user_id, chunk_size=ACCOUNT_DELETE_CHUNK)
+            print(f"🗑️ Conta {user_id} excluída em {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Erro ao excluir conta {user_id}: {e}")
+        finally:
+            db.session.remove()
+
+@app.cli.command('purge-deleted-users')
+@click.option('--minutes', default=30, show_default=True, help='Só exclusões pedidas há mais que isso (a thread do worker pode estar rodando)')
+def purge_deleted_users_command(minutes):
+    """Conclui exclusões de contas interrompidas (ex.: worker reiniciado)"""
+    cutoff = datetime.utcnow() - timedelta(minutes=minutes)
+    pending = [user_id for (user_id,) in db.session.query(User.id).filter(User.deletion_requested_at < cutoff)]
+    for user_id in pending:
+        purge_user(user_id, chunk_size=ACCOUNT_DELETE_CHUNK)
+        print(f"🗑️ Conta {user_id} excluída")
+    print(f"✅ {len(pending)} contas pendentes processadas")
+
+# ===== PARTICIONAMENTO DE SESSÕES DE ESTUDO =====
+STUDY_PARTITION_MONTHS_AHEAD = 3
+
+def month_start(value, offset=0):
+    """Primeiro dia do mês de `value` deslocado em `offset` meses"""
+    month = value.year * 12 + value.month - 1 + offset
+    return datetime(month // 12, month % 12 + 1, 1)
+
+def study_period_table(start):
+    return f'study_session_{start:%Y_%m}'
+
+def study_partitions():
+    """Nomes das partições atuais de study_session (PostgreSQL)"""
+    rows = db.session.execute(db.text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'study_session'"
+    ))
+    return {name for (name,) in rows}
+
+def study_partition_ddl(start):
+    """CREATE da partição do mês que começa em `start` (None: partição DEFAULT)"""
+    if start is None:
+        return "CREATE TABLE IF NOT EXISTS study_session_default PARTITION OF study_session DEFAULT"
+    return (
+        f"CREATE TABLE IF NOT EXISTS {study_period_table(start)} PARTITION OF study_session "
+        f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{month_start(start, 1):%Y-%m-%d}')"
+    )
+
+def attach_study_partition(conn, start):
+    """Cria a partição do mês levando para ela as linhas que já caíram na DEFAULT"""
+    table = study_period_table(start)
+    end = month_start(start, 1)
+    conn.execute(db.text(f"CREATE TABLE {table} (LIKE study_session INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(db.text(
+        f"WITH moved AS (DELETE FROM study_session_default "
+        f"WHERE start_time >= :start AND start_time < :end RETURNING *) "
+        f"INSERT INTO {table} SELECT * FROM moved"
+    ), {'start': start, 'end': end})
+    # Os índices do pai são criados na partição pelo ATTACH
+    conn.execute(db.text(
+        f"ALTER TABLE study_session ATTACH PARTITION {table} "
+        f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    ))
+
+def ensure_study_partitions(months_ahead=STUDY_PARTITION_MONTHS_AHEAD):
+    """PostgreSQL: cria as partições mensais do mês atual até `months_ahead` à frente"""
+    if not IS_POSTGRES:
+        return
+    existing = study_partitions()
+    db.session.rollback()
+    now = datetime.utcnow()
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(db.text(study_partition_ddl(None)))
+    except Exception as e:
+        print(f"⚠️ Não foi possível criar a partição DEFAULT: {e}")
+        return
+    
+    # Sem o cron mensal, sessões de meses sem partição ficam na DEFAULT;
+    # elas são movidas na mesma transação que cria a partição do mês
+    for i in range(months_ahead + 1):
+        start = month_start(now, i)
+        if study_period_table(start) in existing:
+            continue
+        try:
+            with db.engine.begin() as conn:
+                attach_study_partition(conn, start)
+        except Exception as e:
+            print(f"⚠️ Não foi possível criar partição {study_period_table(start)}: {e}")
+
+@app.cli.command('ensure-study-partitions')
+@click.option('--months-ahead', default=STUDY_PARTITION_MONTHS_AHEAD, help='Meses futuros com partição pronta')
+def ensure_study_partitions_command(months_ahead):
+    """Cria as partições mensais de study_session que ainda faltam (rodar pelo cron)"""
+    ensure_study_partitions(months_ahead)
+    print("✅ Partições verificadas")
+
+def study_seconds_by_day(user_id, start, end=None):
+    """{data: (sessões, segundos)} somando a tabela quente e os resumos arquivados"""
+    day_col = db.func.date(StudySession.start_time)
+    hot = db.session.query(
+        day_col, db.func.count(StudySession.id), db.func.sum(StudySession.duration_seconds)
+    ).filter(StudySession.user_id == user_id, StudySession.start_time >= start)
+    archived = db.session.query(
+        StudyDailySummary.date, StudyDailySummary.sessions, StudyDailySummary.seconds
+    ).filter(StudyDailySummary.user_id == user_id, StudyDailySummary.date >= start.date())
+    if end is not None:
+        hot = hot.filter(StudySession.start_time < end)
+        archived = archived.filter(StudyDailySummary.date < end.date())
+    
+    per_day = {}
+    for day, count, seconds in list(hot.group_by(day_col)) + list(archived):
+        day = _as_date(day)
+        previous_count, previous_seconds = per_day.get(day, (0, 0))
+        per_day[day] = (previous_count + count, previous_seconds + int(seconds or 0))
+    return per_day
+
+def compact_study_period(start, end):
+    """Soma as sessões do período em StudyDailySummary (sem commit)"""
+    day_col = db.func.date(StudySession.start_time)
+    rows = (
+        db.session.query(
+            StudySession.user_id, day_col,
+            db.func.count(StudySession.id), db.func.sum(StudySession.duration_seconds)
+        )
+        .filter(StudySession.start_time >= start, StudySession.start_time < end)
+        .group_by(StudySession.user_id, day_col)
+        .all()
+    )
+    stmt = upsert(StudyDailySummary)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'date'],
+        set_={
+            'sessions': StudyDailySummary.sessions + stmt.excluded.sessions,
+            'seconds': StudyDailySummary.seconds + stmt.excluded.seconds
+        }
+    )
+    summaries = [
+        {'user_id': user_id, 'date': _as_date(day), 'sessions': count, 'seconds': int(seconds or 0)}
+        for user_id, day, count, seconds in rows
+    ]
+    for i in range(0, len(summaries), 1000):
+        db.session.execute(stmt, summaries[i:i + 1000])
+    return len(summaries)
+
+@app.cli.command('archive-study-sessions')
+@click.option('--months', default=12, help='Meses mantidos na tabela quente')
+@click.option('--drop', is_flag=True, help='Apagar os períodos antigos em vez de guardá-los em tabelas de arquivo')
+def archive_study_sessions_command(months, drop):
+    """Resume por dia os meses antigos de study_session e os retira da tabela quente"""
+    ensure_study_partitions()
+    cutoff = month_start(datetime.utcnow(), -months)
+    oldest = db.session.query(db.func.min(StudySession.start_time)).filter(StudySession.start_time < cutoff).scalar()
+    if oldest is None:
+        print("✅ Nada para arquivar")
+        return
+    
+    partitions = study_partitions() if IS_POSTGRES else set()
+    period = month_start(oldest)
+    while period < cutoff:
+        period_end = month_start(period, 1)
+        table = study_period_table(period)
+        summaries = compact_study_period(period, period_end)
+        
+        # PostgreSQL: a partição do mês vira uma tabela independente
+        if table in partitions:
+            db.session.execute(db.text(f'ALTER TABLE study_session DETACH PARTITION {table}'))
+            if drop:
+                db.session.execute(db.text(f'DROP TABLE {table}'))
+        
+        # Linhas restantes (SQLite ou partição DEFAULT) vão para a tabela do período
+        in_period = 'start_time >= :start AND start_time < :end'
+        params = {'start': period, 'end': period_end}
+        if not drop:
+            db.session.execute(db.text(f'CREATE TABLE IF NOT EXISTS {table} AS SELECT * FROM study_session WHERE 1 = 0'))
+            db.session.execute(db.text(f'INSERT INTO {table} SELECT * FROM study_session WHERE {in_period}'), params)
+        moved = db.session.execute(db.text(f'DELETE FROM study_session WHERE {in_period}'), params).rowcount
+        db.session.commit()
+        print(f"📦 {period:%Y-%m}: {summaries} resumos diários, {moved} linhas removidas da tabela quente")
+        
+        # Pular meses sem dados
+        next_start = db.session.query(db.func.min(StudySession.start_time)).filter(
+            StudySession.start_time >= period_end, StudySession.start_time < cutoff
+        ).scalar()
+        period = month_start(next_start) if next_start else cutoff
+    print("✅ Arquivamento concluído")
+
+# ===== ANALYTICS DA PLATAFORMA =====
+ANALYTICS_COUNTERS = ('active_users', 'new_users', 'study_sessions', 'study_seconds', 'notes_created')
+_active_seen = set()  # (data, user_id) já registrados neste processo
+
+def upsert(model):
+    """INSERT com suporte a ON CONFLICT no PostgreSQL e no SQLite"""
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    return dialect.insert(model)
+
+def bump_platform_stats(day, **increments):
+    """Soma os incrementos na linha do dia com um único UPSERT"""
+    values = {k: v for k, v in increments.items() if v}
+    if not values:
+        return
+    stmt = upsert(PlatformDailyStats).values(date=day, **values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['date'],
+        set_={k: getattr(PlatformDailyStats, k) + stmt.excluded[k] for k in values}
+    )
+    db.session.execute(stmt)
+
+def record_activity(user_id, day=None, **increments):
+    """Registra atividade do usuário no dia e atualiza os agregados (sem commit)"""
+    day = day or datetime.utcnow().date()
+    if (day, user_id) not in _active_seen:
+        stmt = upsert(DailyActiveUser).values(date=day, user_id=user_id).on_conflict_do_nothing()
+        if db.session.execute(stmt).rowcount:
+            increments['active_users'] = increments.get('active_users', 0) + 1
+        # Só entra em _active_seen depois do commit (remember_active_users)
+        db.session.info.setdefault('active_seen', set()).add((day, user_id))
+    bump_platform_stats(day, **increments)
+
+@event.listens_for(RoutingSession, 'after_commit')
+def remember_active_users(session):
+    seen = session.info.pop('active_seen', None)
+    if seen:
+        if len(_active_seen) > 100000:
+            _active_seen.clear()
+        _active_seen.update(seen)
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def forget_active_users(session):
+    # Transação desfeita: o DailyActiveUser não foi gravado, a próxima escrita tenta de novo
+    session.info.pop('active_seen', None)
+
+def bump_platform_counter(name, delta):
+    """Soma `delta` ao contador global com um único UPSERT (sem commit)"""
+    stmt = upsert(PlatformCounter).values(name=name, value=delta)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['name'],
+        set_={'value': PlatformCounter.value + stmt.excluded.value}
+    ))
+
+def ensure_platform_counters():
+    """Preenche os contadores que ainda não existem (bancos anteriores aos contadores)"""
+    if db.session.get(PlatformCounter, 'users') is None:
+        db.session.add(PlatformCounter(name='users', value=User.query.count()))
+        db.session.commit()
+
+def _as_date(value):
+    # func.date() devolve string no SQLite e date no PostgreSQL
+    return value if hasattr(value, 'year') else datetime.strptime(str(value), '%Y-%m-%d').date()
+
+@app.cli.command('rebuild-analytics')
+@click.option('--days', default=30, help='Dias (a partir de hoje) a recalcular')
+@click.option('--keep-days', default=90, help='Dias de DailyActiveUser a manter')
+def rebuild_analytics_command(days, keep_days):
+    """Recalcula os agregados diários a partir das tabelas e compacta os ativos antigos"""
+    start_day = datetime.utcnow().date() - timedelta(days=days - 1)
+    start = datetime(start_day.year, start_day.month, start_day.day)
+    totals = {}
+
+    def collect(column, **aggregates):
+        day_col = db.func.date(column)
+        rows = db.session.query(day_col, *aggregates.values()).filter(column >= start).group_by(day_col)
+        for row in rows:
+            day_totals = totals.setdefault(_as_date(row[0]), dict.fromkeys(ANALYTICS_COUNTERS, 0))
+            for name, value in zip(aggregates, row[1:]):
+                day_totals[name] = int(value or 0)
+
+    collect(User.created_at, new_users=db.func.count(User.id))
+    collect(Note.created_at, notes_created=db.func.count(Note.id))
+    collect(StudySession.start_time,
+            study_sessions=db.func.count(StudySession.id),
+            study_seconds=db.func.sum(StudySession.duration_seconds))
+    archived = (
+        db.session.query(StudyDailySummary.date, db.func.sum(StudyDailySummary.sessions), db.func.sum(StudyDailySummary.seconds))
+        .filter(StudyDailySummary.date >= start_day)
+        .group_by(StudyDailySummary.date)
+    )
+    for day, count, seconds in archived:
+        day_totals = totals.setdefault(_as_date(day), dict.fromkeys(ANALYTICS_COUNTERS, 0))
+        day_totals['study_sessions'] += int(count or 0)
+        day_totals['study_seconds'] += int(seconds or 0)
+
+    # Ativos: quem já estava registrado + quem estudou ou criou notas no período
+    for column, user_col, join in (
+        (StudySession.start_time, StudySession.user_id, None),
+        (Note.created_at, Folder.user_id, Note.folder),
+    ):
+        query = db.session.query(db.func.date(column), user_col).filter(column >= start).distinct()
+        if join is not None:
+            query = query.join(join)
+        for day, user_id in query:
+            db.session.execute(upsert(DailyActiveUser).values(date=_as_date(day), user_id=user_id).on_conflict_do_nothing())
+    active = (
+        db.session.query(DailyActiveUser.date, db.func.count())
+        .filter(DailyActiveUser.date >= start_day)
+        .group_by(DailyActiveUser.date)
+    )
+    for day, count in active:
+        totals.setdefault(_as_date(day), dict.fromkeys(ANALYTICS_COUNTERS, 0))['active_users'] = count
+
+    PlatformDailyStats.query.filter(PlatformDailyStats.date >= start_day).delete(synchronize_session=False)
+    db.session.add_all(PlatformDailyStats(date=day, **values) for day, values in totals.items())
+    db.session.merge(PlatformCounter(name='users', value=User.query.count()))
+
+    cutoff = datetime.utcnow().date() - timedelta(days=keep_days)
+    removed = DailyActiveUser.query.filter(DailyActiveUser.date < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    _active_seen.clear()
+    print(f"✅ {len(totals)} dias recalculados, {removed} registros de ativos antigos removidos")
 
 # Rotas
 # ===== ROTAS DE AUTENTICAÇÃO =====
@@ -181,10 +1082,23 @@ def login_page():
 
 @app.route('/app')
 @login_required
+@read_only
 def index():
     user = User.query.get(session['user_id'])
+    if user is None and read_from_primary():
+        user = User.query.get(session['user_id'])
+    if user is None:
+        session.clear()
+        return redirect(url_for('login_page'))
     show_welcome = session.pop('show_welcome', False)
-    return render_template('index.html', user=user, show_welcome=show_welcome)
+    # Dados iniciais embutidos na página: o SPA não precisa de fetches antes de ficar utilizável
+    bootstrap = {
+        'folders': folders_with_counts(user.id),
+        'routine': routine_for_date(user.id, routine_date_for_day()),
+        'stats': study_stats_summary(user.id)
+    }
+    return render_template('index.html', user=user, show_welcome=show_welcome, bootstrap=bootstrap,
+                           import_max_bytes=IMPORT_MAX_BYTES)
 
 # ===== ROTAS DE ADMIN =====
 @app.route('/admin')
@@ -198,15 +1112,76 @@ def admin_page():
 @app.route('/api/admin/users', methods=['GET'])
 @admin_required
 def get_all_users():
-    users = User.query.all()
+    folders_count = (
+        db.session.query(Folder.user_id, db.func.count(Folder.id).label('total'))
+        .group_by(Folder.user_id)
+        .subquery()
+    )
+    users = (
+        db.session.query(User, db.func.coalesce(folders_count.c.total, 0))
+        .outerjoin(folders_count, folders_count.c.user_id == User.id)
+        .filter(User.deletion_requested_at.is_(None))
+        .all()
+    )
     return jsonify([{
         'id': u.id,
         'name': u.name,
         'email': u.email,
         'is_admin': u.is_admin,
         'created_at': u.created_at.isoformat(),
-        'folders_count': len(u.folders)
-    } for u in users])
+        'folders_count': total
+    } for u, total in users])
+
+@app.route('/api/admin/analytics', methods=['GET'])
+@admin_required
+@read_only
+def get_platform_analytics():
+    """Métricas da plataforma lidas dos agregados diários (custo independe do nº de usuários)"""
+    days = min(max(request.args.get('days', 30, type=int), 1), 365)
+    today = datetime.utcnow().date()
+    start_day = today - timedelta(days=days - 1)
+    
+    rows = {
+        r.date: r for r in PlatformDailyStats.query.filter(PlatformDailyStats.date >= start_day)
+    }
+    daily = []
+    for i in range(days):
+        day = start_day + timedelta(days=i)
+        row = rows.get(day)
+        daily.append({'date': day.isoformat(), **{k: (getattr(row, k) if row else 0) for k in ANALYTICS_COUNTERS}})
+    
+    all_time = db.session.query(
+        db.func.sum(PlatformDailyStats.study_seconds),
+        db.func.sum(PlatformDailyStats.notes_created)
+    ).one()
+    # Contas existentes: contador mantido no cadastro/exclusão (init-db preenche bancos antigos)
+    users = db.session.query(PlatformCounter.value).filter_by(name='users').scalar()
+    if users is None:
+        users = User.query.count()
+    
+    return jsonify({
+        'today': daily[-1],
+        'daily': daily,
+        'period': {
+            'study_seconds': sum(d['study_seconds'] for d in daily),
+            'notes_created': sum(d['notes_created'] for d in daily),
+            'new_users': sum(d['new_users'] for d in daily)
+        },
+        'all_time': {
+            'users': int(users),
+            'study_seconds': int(all_time[0] or 0),
+            'notes_created': int(all_time[1] or 0)
+        }
+    })
+
+@app.route('/api/admin/admission', methods=['GET'])
+@admin_required
+def get_admission_stats():
+    """Fila e descartes de cada classe de endpoint (contadores deste worker)"""
+    return jsonify({
+        'pid': os.getpid(),
+        'classes': {name: c.stats() for name, c in admission_classes.items()}
+    })
 
 @app.route('/api/admin/users/<int:user_id>', methods=['DELETE'])
 @admin_required
@@ -216,8 +1191,17 @@ def delete_user(user_id):
         return jsonify({'success': False, 'message': 'Você não pode deletar sua própria conta'}), 400
     
     user = User.query.get_or_404(user_id)
-    db.session.delete(user)
-    db.session.commit()
+    if user.deletion_requested_at:
+        return jsonify({'success': True, 'message': 'Exclusão já está em andamento'}), 202
+    
+    # Contas grandes: marcar e apagar em segundo plano para não prender o worker
+    if account_size(user_id) > ACCOUNT_DELETE_ASYNC_THRESHOLD:
+        user.deletion_requested_at = datetime.utcnow()
+        db.session.commit()
+        threading.Thread(target=run_account_deletion, args=(user_id,), daemon=True).start()
+        return jsonify({'success': True, 'message': 'Exclusão iniciada em segundo plano'}), 202
+    
+    purge_user(user_id)
     return jsonify({'success': True, 'message': 'Usuário deletado com sucesso'})
 
 @app.route('/api/admin/users/<int:user_id>/toggle-admin', methods=['POST'])
@@ -267,6 +1251,9 @@ def register():
         password_hash = generate_password_hash(password)
         user = User(name=name, email=email, password_hash=password_hash, is_admin=is_first_user)
         db.session.add(user)
+        db.session.flush()
+        record_activity(user.id, new_users=1)
+        bump_platform_counter('users', 1)
         db.session.commit()
         
         # Login automático
@@ -294,9 +1281,12 @@ def login():
         # Buscar usuário
         user = User.query.filter_by(email=email).first()
         
-        if not user or not check_password_hash(user.password_hash, password):
+        if not user or user.deletion_requested_at or not check_password_hash(user.password_hash, password):
             return jsonify({'success': False, 'message': 'Email ou senha incorretos'}), 401
         
+        record_activity(user.id)
+        db.session.commit()
+        
         # Criar sessão
         session['user_id'] = user.id
         session['user_name'] = user.name
@@ -317,22 +1307,32 @@ def logout():
 # ===== API - PASTAS =====
 @app.route('/api/folders', methods=['GET'])
 @login_required
+@read_only
 def get_folders():
-    user_id = session.get('user_id')
-    folders = Folder.query.filter_by(user_id=user_id).all()
-    return jsonify([{
-        'id': f.id,
-        'name': f.name,
-        'created_at': f.created_at.isoformat(),
-        'notes_count': len(f.notes)
-    } for f in folders])
+    return jsonify(folders_with_counts(session.get('user_id')))
+
+def folders_with_counts(user_id):
+    """Pastas do usuário com o número de notas (uma consulta agrupada)"""
+    rows = (
+        db.session.query(Folder.id, Folder.name, Folder.created_at, db.func.count(Note.id))
+        .outerjoin(Note, Note.folder_id == Folder.id)
+        .filter(Folder.user_id == user_id)
+        .group_by(Folder.id, Folder.name, Folder.created_at)
+        .order_by(Folder.id)
+    )
+    return [{
+        'id': folder_id,
+        'name': name,
+        'created_at': created_at.isoformat(),
+        'notes_count': notes_count
+    } for folder_id, name, created_at, notes_count in rows]
 
 @app.route('/api/folders', methods=['POST'])
 @login_required
 def create_folder():
     user_id = session.get('user_id')
     data = request.get_json()
-    folder = Folder(name=data['name'], user_id=user_id)
+    folder = Folder(name=data['name'], user_id=user_id, revision=next_revision(user_id))
     db.session.add(folder)
     db.session.commit()
     return jsonify({
@@ -346,13 +1346,20 @@ def create_folder():
 def delete_folder(folder_id):
     user_id = session.get('user_id')
     folder = Folder.query.filter_by(id=folder_id, user_id=user_id).first_or_404()
-    db.session.delete(folder)
+    revision = next_revision(user_id)
+    note_ids = [note_id for (note_id,) in db.session.query(Note.id).filter_by(folder_id=folder.id)]
+    add_tombstones(user_id, 'note', note_ids, revision)
+    add_tombstones(user_id, 'folder', [folder.id], revision)
+    # DELETE por conjunto: as notas não são carregadas na memória
+    Note.query.filter_by(folder_id=folder.id).delete(synchronize_session=False)
+    Folder.query.filter_by(id=folder.id).delete(synchronize_session=False)
     db.session.commit()
     return '', 204
 
 # API - Notas
 @app.route('/api/folders/<int:folder_id>/notes', methods=['GET'])
 @login_required
+@read_only
 def get_notes(folder_id):
     user_id = session.get('user_id')
     # Verificar se a pasta pertence ao usuário
@@ -376,9 +1383,11 @@ def create_note():
     note = Note(
         title=data['title'],
         content=data.get('content', ''),
-        folder_id=data['folder_id']
+        folder_id=data['folder_id'],
+        revision=next_revision(user_id)
     )
     db.session.add(note)
+    record_activity(user_id, notes_created=1)
     db.session.commit()
     return jsonify({
         'id': note.id,
@@ -402,6 +1411,8 @@ def update_note(note_id):
         note.content = data['content']
     
     note.updated_at = datetime.utcnow()
+    note.revision = next_revision(user_id)
+    record_activity(user_id)
     db.session.commit()
     
     return jsonify({
@@ -418,16 +1429,168 @@ def delete_note(note_id):
     note = Note.query.get_or_404(note_id)
     # Verificar se a nota pertence a uma pasta do usuário
     folder = Folder.query.filter_by(id=note.folder_id, user_id=user_id).first_or_404()
+    add_tombstones(user_id, 'note', [note.id], next_revision(user_id))
     db.session.delete(note)
     db.session.commit()
     return '', 204
 
+# ===== NOTAS RELACIONADAS (TF-IDF LOCAL) =====
+# Cada nota guarda seus termos já contados (NoteVector); só notas novas ou editadas são
+# reprocessadas. A matriz TF-IDF do usuário fica em memória (numpy) e é refeita quando
+# as notas mudam; a consulta é um produto esparso vetorizado, sem chamar o Gemini.
+RELATED_MAX_K = 20
+RELATED_REFRESH_BATCH = 500
+RELATED_CACHE_USERS = int(os.getenv('RELATED_CACHE_USERS', 32))  # matrizes em memória por processo
+RELATED_STOPWORDS = frozenset("""
+    para com uma por mais como mas dos das nos nas que sao nao seu sua seus suas pelo pela
+    pelos pelas este esta isso isto esse essa aos ate sem sob sobre entre tambem quando
+    muito muita ser ter foi era the and for with from that this are was
+""".split())
+_related_indexes = OrderedDict()  # user_id -> (chave, RelatedIndex)
+_related_lock = threading.Lock()
+
+def note_terms(title, content):
+    """Termos normalizados (minúsculas, sem acento, 3+ caracteres, sem stopwords)"""
+    text = unicodedata.normalize('NFKD', f'{title or ""} {content or ""}'.lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return [t for t in re.findall(r'[a-z0-9]{3,}', text) if t not in RELATED_STOPWORDS]
+
+def encode_note_terms(title, content):
+    """Formato compacto: hashes crc32 ordenados (uint32) seguidos das contagens (uint16)"""
+    import numpy as np
+    hashes = np.array([zlib.crc32(t.encode()) for t in note_terms(title, content)], dtype=np.uint32)
+    terms, counts = np.unique(hashes, return_counts=True)
+    return terms.tobytes() + np.minimum(counts, 65535).astype(np.uint16).tobytes()
+
+def decode_note_terms(blob):
+    import numpy as np
+    n = len(blob) // 6
+    return np.frombuffer(blob, dtype=np.uint32, count=n), np.frombuffer(blob, dtype=np.uint16, offset=n * 4, count=n)
+
+class RelatedIndex:
+    """Matriz TF-IDF esparsa (formato coordenada) das notas de um usuário"""
+    
+    def __init__(self, vectors):
+        import numpy as np
+        self.note_ids = np.array([note_id for note_id, _ in vectors], dtype=np.int64)
+        self.position = {int(note_id): i for i, note_id in enumerate(self.note_ids)}
+        decoded = [decode_note_terms(blob) for _, blob in vectors]
+        lengths = np.array([len(terms) for terms, _ in decoded], dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(lengths)))
+        n = len(vectors)
+        
+        all_terms = np.concatenate([terms for terms, _ in decoded]) if n else np.zeros(0, np.uint32)
+        counts = np.concatenate([c for _, c in decoded]).astype(np.float64) if n else np.zeros(0)
+        self.doc = np.repeat(np.arange(n), lengths)
+        self.vocab, self.term = np.unique(all_terms, return_inverse=True)
+        df = np.bincount(self.term, minlength=len(self.vocab))
+        idf = np.log((1 + n) / (1 + df)) + 1
+        weight = (1 + np.log(counts)) * idf[self.term]
+        norms = np.sqrt(np.bincount(self.doc, weights=weight * weight, minlength=n))
+        self.weight = weight / np.maximum(norms, 1e-12)[self.doc]
+    
+    def related(self, note_id, k):
+        """Notas mais parecidas por similaridade de cosseno: [(note_id, score)]"""
+        import numpy as np
+        i = self.position.get(note_id)
+        if i is None or len(self.note_ids) < 2:
+            return []
+        start, end = self.offsets[i], self.offsets[i + 1]
+        query = np.zeros(len(self.vocab))
+        query[self.term[start:end]] = self.weight[start:end]
+        scores = np.bincount(self.doc, weights=self.weight * query[self.term], minlength=len(self.note_ids))
+        scores[i] = 0
+        k = min(k, len(scores) - 1)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.note_ids[j]), float(scores[j])) for j in top if scores[j] > 0]
+
+def refresh_note_vectors(user_id):
+    """Recalcula os termos só das notas novas ou editadas desde o último cálculo"""
+    stale = (
+        db.session.query(Note.id, Note.title, Note.content, Note.revision)
+        .join(Folder, Folder.id == Note.folder_id)
+        .outerjoin(NoteVector, NoteVector.note_id == Note.id)
+        .filter(Folder.user_id == user_id)
+        .filter(db.or_(NoteVector.note_id.is_(None), NoteVector.revision != Note.revision))
+        .all()
+    )
+    # UPSERT: duas requisições recalculando a mesma nota não colidem na chave primária
+    stmt = upsert(NoteVector)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['note_id'],
+        set_={'revision': stmt.excluded.revision, 'terms': stmt.excluded.terms}
+    )
+    for i in range(0, len(stale), RELATED_REFRESH_BATCH):
+        batch = stale[i:i + RELATED_REFRESH_BATCH]
+        db.session.execute(stmt, [
+            {'note_id': note_id, 'user_id': user_id, 'revision': revision, 'terms': encode_note_terms(title, content)}
+            for note_id, title, content, revision in batch
+        ])
+    if stale:
+        db.session.commit()
+    return len(stale)
+
+def related_index(user_id):
+    """Índice do usuário em cache; refeito quando muda o nº de notas ou a maior revisão"""
+    key = tuple(
+        db.session.query(db.func.count(Note.id), db.func.max(Note.revision))
+        .join(Folder, Folder.id == Note.folder_id)
+        .filter(Folder.user_id == user_id)
+        .one()
+    )
+    with _related_lock:
+        cached = _related_indexes.get(user_id)
+        if cached and cached[0] == key:
+            _related_indexes.move_to_end(user_id)
+            return cached[1]
+    
+    refresh_note_vectors(user_id)
+    vectors = (
+        db.session.query(NoteVector.note_id, NoteVector.terms)
+        .filter(NoteVector.user_id == user_id)
+        .order_by(NoteVector.note_id)
+        .all()
+    )
+    index = RelatedIndex(vectors)
+    with _related_lock:
+        _related_indexes[user_id] = (key, index)
+        _related_indexes.move_to_end(user_id)
+        while len(_related_indexes) > RELATED_CACHE_USERS:
+            _related_indexes.popitem(last=False)
+    return index
+
+@app.route('/api/notes/<int:note_id>/related', methods=['GET'])
+@login_required
+def get_related_notes(note_id):
+    """Notas parecidas do mesmo usuário (qualquer pasta), calculadas localmente"""
+    user_id = session['user_id']
+    Note.query.join(Folder).filter(Note.id == note_id, Folder.user_id == user_id).first_or_404()
+    k = min(max(request.args.get('k', 5, type=int), 1), RELATED_MAX_K)
+    
+    matches = related_index(user_id).related(note_id, k)
+    if not matches:
+        return jsonify([])
+    rows = {
+        note.id: (note, folder_name) for note, folder_name in
+        db.session.query(Note, Folder.name).join(Folder).filter(Note.id.in_([m for m, _ in matches]))
+    }
+    return jsonify([{
+        'id': related_id,
+        'title': rows[related_id][0].title,
+        'folder_id': rows[related_id][0].folder_id,
+        'folder_name': rows[related_id][1],
+        'score': round(score, 4)
+    } for related_id, score in matches if related_id in rows])
+
 # API - Sessões de Estudo
 @app.route('/api/study-sessions', methods=['GET'])
 @login_required
+@read_only
 def get_study_sessions():
     user_id = session.get('user_id')
-    sessions = StudySession.query.filter_by(user_id=user_id).order_by(StudySession.created_at.desc()).limit(10).all()
+    # Ordenar pela chave de partição: o PostgreSQL lê só as partições mais recentes
+    sessions = StudySession.query.filter_by(user_id=user_id).order_by(StudySession.start_time.desc()).limit(10).all()
     return jsonify([{
         'id': s.id,
         'start_time': s.start_time.isoformat(),
@@ -462,6 +1625,12 @@ def create_study_session():
             duration_seconds=data.get('duration_seconds', 0)
         )
         db.session.add(study_session)
+        record_activity(
+            user_id,
+            day=study_session.start_time.date(),
+            study_sessions=1,
+            study_seconds=study_session.duration_seconds or 0
+        )
         db.session.commit()
         
         print(f"Sessão salva com sucesso! ID: {study_session.id}")
@@ -473,210 +1642,838 @@ def create_study_session():
 
 # ===== APIs DE MÚSICA/YOUTUBE REMOVIDAS =====
 
-#
+# ===== ASSISTENTE DE IA (GEMINI) =====
+AI_MODEL = 'gemini-2.5-flash'
+GEMINI_RPM = int(os.getenv('GEMINI_RPM', 15))  # cota da conta, somando todos os workers
+WEB_CONCURRENCY = max(int(os.getenv('WEB_CONCURRENCY', 1)), 1)  # nº de workers do gunicorn
+GEMINI_RPM_PER_WORKER = max(GEMINI_RPM // WEB_CONCURRENCY, 1)
+AI_BATCH_MAX = int(os.getenv('AI_BATCH_MAX', 8))  # perguntas por chamada ao Gemini
+AI_BATCH_WINDOW = float(os.getenv('AI_BATCH_WINDOW_MS', 300)) / 1000  # janela de agrupamento do /api/chat
+AI_BATCH_TIMEOUT = 90  # segundos que uma requisição espera pela resposta do lote
+
+ASSISTANT_INSTRUCTIONS = """Você é um assistente de estudos amigável e prestativo chamado BNStudy Assistant.
+        Ajude estudantes com suas dúvidas, explique conceitos de forma clara e objetiva.
+        Forneça dicas de estudo e seja sempre educado e motivador."""
+
+def is_quota_error(error_message):
+    return '429' in error_message or 'quota' in error_message.lower() or 'RESOURCE_EXHAUSTED' in error_message
+
+class GeminiRateLimiter:
+    """Janela deslizante de 60s: no máximo `rpm` chamadas ao Gemini por processo (worker)"""
+
+    def __init__(self, rpm, max_wait=15):
+        self.rpm = rpm
+        self.max_wait = max_wait
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= 60:
+                    self._calls.popleft()
+                if len(self._calls) < self.rpm:
+                    self._calls.append(now)
+                    return
+                wait = 60 - (now - self._calls[0])
+            if now + wait > deadline:
+                raise RuntimeError('429 RESOURCE_EXHAUSTED: limite local de requisições por minuto')
+            time.sleep(wait)
+
+gemini_rate_limiter = GeminiRateLimiter(GEMINI_RPM_PER_WORKER)
+
+def generate_ai_content(prompt, config=None):
+    """Chama o Gemini respeitando o limite por minuto (até 2 tentativas em erro de quota)"""
+    client = get_ai_client()
+    max_retries = 2
+    retry_delay = 4
+    
+    for attempt in range(max_retries):
+        gemini_rate_limiter.acquire()
+        try:
+            response = client.models.generate_content(
+                model=AI_MODEL,
+                contents=prompt,
+                config=config
+            )
+            return response.text
+        except Exception as retry_error:
+            # Se for erro de quota e não for última tentativa, aguardar e tentar novamente
+            if is_quota_error(str(retry_error)) and attempt < max_retries - 1:
+                print(f"⏳ Tentativa {attempt + 1} falhou. Aguardando {retry_delay}s antes de tentar novamente...")
+                time.sleep(retry_delay)
+                retry_delay *= 2  # Dobrar delay para próxima tentativa
+                continue
+            raise
+
+def ai_error_message(error_message):
+    """Mensagem amigável para erros da API do Gemini"""
+    if 'API_KEY_INVALID' in error_message or 'invalid' in error_message.lower():
+        return ('🔑 API key inválida!\n\n'
+                '📍 Como resolver:\n'
+                '1. Acesse: https://aistudio.google.com/apikey\n'
+                '2. Crie uma nova API key\n'
+                '3. Substitua no arquivo .env\n\n'
+                '💡 É 100% gratuito!')
+    elif is_quota_error(error_message):
+        return ('⏱️ Limite de requisições atingido.\n\n'
+                '📊 Usando gemini-2.5-flash (modelo mais recente).\n'
+                '✨ Limite: 15 requisições por minuto.\n\n'
+                '🔄 Tente novamente em alguns segundos!')
+    elif 'limit' in error_message.lower():
+        return ('⏱️ Limite temporário atingido.\n\n'
+                'Aguarde alguns segundos e tente novamente.\n'
+                'O Google Gemini é gratuito mas tem limite por minuto.')
+    return (f'🤖 Desculpe, ocorreu um erro ao processar sua mensagem.\n\n'
+            f'💡 Tente perguntar de outra forma ou aguarde alguns segundos.\n\n'
+            f'Erro: {error_message[:150]}')
+
+def build_batch_prompt(questions):
+    """Junta várias perguntas em um único prompt que pede respostas em JSON"""
+    numbered = '\n'.join(f'[{i}] {q}' for i, q in enumerate(questions, start=1))
+    return f"""{ASSISTANT_INSTRUCTIONS}
+        
+        Responda separadamente cada uma das {len(questions)} perguntas abaixo (máximo 200 palavras cada).
+        Retorne SOMENTE um array JSON no formato [{{"id": <número da pergunta>, "resposta": "<texto>"}}].
+        
+        Perguntas:
+{numbered}"""
+
+def parse_batch_answers(text, count):
+    """Extrai as respostas por pergunta; posições sem resposta ficam None"""
+    answers = [None] * count
+    text = (text or '').strip()
+    if text.startswith('```'):
+        text = text.strip('`')
+        text = text[text.index('\n') + 1:] if '\n' in text else ''
+    try:
+        items = json.loads(text)
+    except ValueError:
+        return answers
+    if not isinstance(items, list):
+        return answers
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        try:
+            index = int(item.get('id', position + 1)) - 1
+        except (TypeError, ValueError):
+            continue
+        answer = item.get('resposta') or item.get('answer')
+        if 0 <= index < count and isinstance(answer, str) and answers[index] is None:
+            answers[index] = answer.strip()
+    return answers
+
+def answer_questions(questions):
+    """Responde uma lista de perguntas com uma chamada ao Gemini por lote de AI_BATCH_MAX"""
+    if len(questions) == 1:
+        prompt = f"""{ASSISTANT_INSTRUCTIONS}
+        
+        Pergunta do estudante: {questions[0]}
+        
+        Responda de forma concisa (máximo 300 palavras):"""
+        return [generate_ai_content(prompt)]
+    
+    from google.genai import types
+    answers = []
+    for i in range(0, len(questions), AI_BATCH_MAX):
+        chunk = questions[i:i + AI_BATCH_MAX]
+        text = generate_ai_content(
+            build_batch_prompt(chunk),
+            config=types.GenerateContentConfig(response_mime_type='application/json')
+        )
+        parsed = parse_batch_answers(text, len(chunk))
+        answers.extend(
+            a if a is not None else '🤖 Não consegui responder esta pergunta agora. Envie-a novamente.'
+            for a in parsed
+        )
+    return answers
+
+class AIMicroBatcher:
+    """Agrupa perguntas que chegam juntas (threads do mesmo worker) em uma só chamada.
+    Só perguntas com a mesma chave dividem um prompt (ver chat_with_ai)."""
+
+    def __init__(self, window, max_size):
+        self.window = window
+        self.max_size = max_size
+        self._pending = {}  # chave -> [(pergunta, Future)]
+        self._timers = {}  # chave -> Timer da janela
+        self._lock = threading.Lock()
+
+    def submit(self, question, key=None):
+        future = Future()
+        if self.window <= 0:
+            self._run([(question, future)])
+            return future
+        
+        with self._lock:
+            pending = self._pending.setdefault(key, [])
+            pending.append((question, future))
+            if len(pending) >= self.max_size:
+                batch = self._take(key)
+            else:
+                batch = None
+                if key not in self._timers:
+                    timer = threading.Timer(self.window, self._flush, args=(key,))
+                    timer.daemon = True
+                    self._timers[key] = timer
+                    timer.start()
+        if batch:
+            self._run(batch)
+        return future
+
+    def _take(self, key):
+        batch = self._pending.pop(key, [])
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        return batch
+
+    def _flush(self, key):
+        with self._lock:
+            batch = self._take(key)
+        if batch:
+            self._run(batch)
+
+    def _run(self, batch):
+        if len(batch) > 1:
+            print(f"📦 Lote de {len(batch)} perguntas em uma chamada ao Gemini")
+        try:
+            answers = answer_questions([q for q, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), answer in zip(batch, answers):
+            future.set_result(answer)
+
+# Um micro-lote junta só requisições de chat já admitidas: nunca passa do limite da classe
+ai_batcher = AIMicroBatcher(AI_BATCH_WINDOW, min(AI_BATCH_MAX, admission_classes['chat'].limit))
+
+# ===== MEMÓRIA DA CONVERSA =====
+AI_MEMORY_BUDGET = int(os.getenv('AI_MEMORY_TOKENS', 1200))  # tokens de histórico enviados por pergunta
+AI_MEMORY_SUMMARY_TOKENS = 300  # parte do orçamento reservada ao resumo
+AI_MEMORY_COMPACT_AFTER = 400  # tokens fora da janela recente que disparam um novo resumo
+AI_MESSAGE_MAX_TOKENS = 1000
+
+def estimate_tokens(text):
+    """Estimativa local de tokens (~4 caracteres por token)"""
+    return (len(text) + 3) // 4 if text else 0
+
+def truncate_to_tokens(text, max_tokens):
+    """Mantém o final do texto (parte mais recente) dentro do limite de tokens"""
+    max_chars = max_tokens * 4
+    return text if len(text) <= max_chars else text[-max_chars:]
+
+def format_turns(messages):
+    return '\n'.join(
+        f"{'Estudante' if m.role == 'user' else 'Assistente'}: {m.content}" for m in messages
+    )
+
+def compact_conversation(memory, older):
+    """Incorpora mensagens antigas ao resumo (Gemini, com fallback local)"""
+    prompt = f"""Resuma a conversa entre um estudante e o BNStudy Assistant em no máximo {AI_MEMORY_SUMMARY_TOKENS * 3 // 4} palavras.
+        Mantenha os fatos, dúvidas e o contexto necessários para continuar a conversa.
+        
+        Resumo anterior: {memory.summary or '(vazio)'}
+        
+        Novas mensagens:
+{format_turns(older)}
+        
+        Resumo atualizado:"""
+    try:
+        summary = generate_ai_content(prompt).strip()
+    except Exception as e:
+        print(f"⚠️ Erro ao resumir conversa, usando resumo local: {e}")
+        snippets = format_turns(older).splitlines()
+        summary = '\n'.join([memory.summary] + [line[:160] for line in snippets]).strip()
+    
+    memory.summary = truncate_to_tokens(summary, AI_MEMORY_SUMMARY_TOKENS)
+    memory.summary_tokens = estimate_tokens(memory.summary)
+    memory.summarized_until = older[-1].id
+
+def save_conversation_memory(memory):
+    """Grava o resumo antes de esperar o Gemini; o primeiro do usuário via UPSERT,
+    para duas perguntas simultâneas de um usuário novo não colidirem na chave"""
+    if db.inspect(memory).transient:
+        values = {
+            'summary': memory.summary,
+            'summary_tokens': memory.summary_tokens,
+            'summarized_until': memory.summarized_until,
+            'updated_at': datetime.utcnow()
+        }
+        stmt = upsert(ChatMemory).values(user_id=memory.user_id, **values)
+        db.session.execute(stmt.on_conflict_do_update(index_elements=['user_id'], set_=values))
+    db.session.commit()
+
+def build_conversation_context(user_id):
+    """Resumo + mensagens recentes dentro de AI_MEMORY_BUDGET tokens"""
+    memory = db.session.get(ChatMemory, user_id)
+    if memory is None:
+        # Fora da sessão: a linha só é gravada quando houver resumo (ver save_conversation_memory)
+        memory = ChatMemory(user_id=user_id, summary='', summary_tokens=0, summarized_until=0)
+    
+    # Só as mensagens ainda não resumidas (limitadas pela compactação)
+    pending = (
+        ChatMessage.query
+        .filter(ChatMessage.user_id == user_id, ChatMessage.id > memory.summarized_until)
+        .order_by(ChatMessage.id.desc())
+        .all()
+    )
+    
+    recent_budget = AI_MEMORY_BUDGET - AI_MEMORY_SUMMARY_TOKENS
+    recent, used = [], 0
+    for message in pending:
+        if used + message.tokens > recent_budget:
+            break
+        recent.append(message)
+        used += message.tokens
+    recent.reverse()
+    
+    older = list(reversed(pending[len(recent):]))
+    if older and sum(m.tokens for m in older) >= AI_MEMORY_COMPACT_AFTER:
+        compact_conversation(memory, older)
+        save_conversation_memory(memory)
+    
+    parts = []
+    if memory.summary:
+        parts.append(f'Resumo da conversa até aqui:\n{memory.summary}')
+    if recent:
+        parts.append(f'Mensagens recentes:\n{format_turns(recent)}')
+    return '\n\n'.join(parts), memory.summary_tokens + used
+
 @app.route('/api/chat', methods=['POST'])
 @login_required
+@admission('chat')
 def chat_with_ai():
     try:
+        user_id = session['user_id']
         data = request.get_json()
         user_message = data.get('message', '')
         
         if not user_message:
             return jsonify({'error': 'Mensagem vazia'}), 400
         
+        if estimate_tokens(user_message) > AI_MESSAGE_MAX_TOKENS:
+            return jsonify({'error': 'Mensagem muito longa'}), 400
+        
         # Verificar se cliente está configurado
-        if not client:
+        if not get_ai_client():
             return jsonify({
                 'response': '🔑 API do Gemini não configurada!\n\n'
                            '📍 Configure GEMINI_API_KEY no arquivo .env'
             }), 200
         
-        # Criar contexto para o assistente
-        prompt = f"""Você é um assistente de estudos amigável e prestativo chamado BNStudy Assistant.
-        Ajude estudantes com suas dúvidas, explique conceitos de forma clara e objetiva.
-        Forneça dicas de estudo e seja sempre educado e motivador.
+        context, history_tokens = build_conversation_context(user_id)
+        question = f'{context}\n\nPergunta atual: {user_message}' if context else user_message
         
-        Pergunta do estudante: {user_message}
-        
-        Responda de forma concisa (máximo 300 palavras):"""
+        # Perguntas simultâneas dentro da janela viram uma única chamada. Com histórico, o lote
+        # é só do próprio usuário: o contexto de um estudante nunca vai no prompt de outro
+        batch_key = user_id if context else None
+        ai_response = ai_batcher.submit(question, key=batch_key).result(timeout=AI_BATCH_TIMEOUT)
         
-        # Tentar com retry (máximo 2 tentativas)
-        max_retries = 2
-        retry_delay = 4
+        user_tokens = estimate_tokens(user_message)
+        response_tokens = estimate_tokens(ai_response)
+        db.session.add(ChatMessage(user_id=user_id, role='user', content=user_message, tokens=user_tokens))
+        db.session.add(ChatMessage(user_id=user_id, role='assistant', content=ai_response, tokens=response_tokens))
+        db.session.commit()
         
-        for attempt in range(max_retries):
-            try:
-                response = client.models.generate_content(
-                    model='gemini-2.5-flash',
-                    contents=prompt
-                )
-                
-                ai_response = response.text
-                return jsonify({'response': ai_response}), 200
-                
-            except Exception as retry_error:
-                error_msg = str(retry_error)
-                
-                # Se for erro de quota e não for última tentativa, aguardar e tentar novamente
-                if ('429' in error_msg or 'quota' in error_msg.lower() or 'RESOURCE_EXHAUSTED' in error_msg):
-                    if attempt < max_retries - 1:
-                        print(f"⏳ Tentativa {attempt + 1} falhou. Aguardando {retry_delay}s antes de tentar novamente...")
-                        time.sleep(retry_delay)
-                        retry_delay *= 2  # Dobrar delay para próxima tentativa
-                        continue
-                    else:
-                        # Última tentativa falhou
-                        return jsonify({
-                            'response': '⏱️ Serviço temporariamente ocupado.\n\n'
-                                       '🔄 A IA está processando muitas requisições.\n'
-                                       '✨ Aguarde 10 segundos e tente novamente.\n\n'
-                                       '💡 Dica: O limite é de 15 perguntas por minuto.'
-                        }), 200
-                else:
-                    # Outro tipo de erro, propagar
-                    raise retry_error
+        return jsonify({
+            'response': ai_response,
+            'tokens': {
+                'prompt': estimate_tokens(ASSISTANT_INSTRUCTIONS) + estimate_tokens(question),
+                'history': history_tokens,
+                'response': response_tokens,
+                'history_budget': AI_MEMORY_BUDGET
+            }
+        }), 200
         
     except Exception as e:
+        db.session.rollback()
         error_message = str(e)
         print(f"Erro ao chamar API do Gemini: {error_message}")
-        
-        # Tratamento de erros
-        if 'API_KEY_INVALID' in error_message or 'invalid' in error_message.lower():
-            return jsonify({
-                'response': '🔑 API key inválida!\n\n'
-                           '📍 Como resolver:\n'
-                           '1. Acesse: https://aistudio.google.com/apikey\n'
-                           '2. Crie uma nova API key\n'
-                           '3. Substitua no arquivo .env\n\n'
-                           '💡 É 100% gratuito!'
-            }), 200
-        elif '429' in error_message or 'quota' in error_message.lower() or 'RESOURCE_EXHAUSTED' in error_message:
-            return jsonify({
-                'response': '⏱️ Limite de requisições atingido.\n\n'
-                           '📊 Usando gemini-2.5-flash (modelo mais recente).\n'
-                           '✨ Limite: 15 requisições por minuto.\n\n'
-                           '🔄 Tente novamente em alguns segundos!'
-            }), 200
-        elif 'limit' in error_message.lower():
-            return jsonify({
-                'response': '⏱️ Limite temporário atingido.\n\n'
-                           'Aguarde alguns segundos e tente novamente.\n'
-                           'O Google Gemini é gratuito mas tem limite por minuto.'
-            }), 200
-        else:
-            return jsonify({
-                'response': f'🤖 Desculpe, ocorreu um erro ao processar sua mensagem.\n\n'
-                           f'💡 Tente perguntar de outra forma ou aguarde alguns segundos.\n\n'
-                           f'Erro: {error_message[:150]}'
-            }), 200
+        return jsonify({'response': ai_error_message(error_message)}), 200
 
-    db.session.add(session)
+@app.route('/api/chat/history', methods=['GET'])
+@login_required
+@read_only
+def get_chat_history():
+    messages = (
+        ChatMessage.query
+        .filter_by(user_id=session['user_id'])
+        .order_by(ChatMessage.id.desc())
+        .limit(50)
+        .all()
+    )
+    return jsonify([{
+        'role': m.role,
+        'content': m.content,
+        'created_at': m.created_at.isoformat()
+    } for m in reversed(messages)])
+
+@app.route('/api/chat/history', methods=['DELETE'])
+@login_required
+def clear_chat_history():
+    """Começa uma nova conversa (apaga histórico e resumo)"""
+    ChatMessage.query.filter_by(user_id=session['user_id']).delete(synchronize_session=False)
+    ChatMemory.query.filter_by(user_id=session['user_id']).delete(synchronize_session=False)
     db.session.commit()
-    return jsonify({'id': session.id}), 201
+    return '', 204
+
+@app.route('/api/chat/batch', methods=['POST'])
+@login_required
+@admission('chat')
+def chat_batch():
+    """Responde várias perguntas (modo revisão) gastando uma requisição do Gemini por lote"""
+    data = request.get_json() or {}
+    questions = [q.strip() for q in data.get('questions', []) if isinstance(q, str) and q.strip()]
+    
+    if not questions:
+        return jsonify({'error': 'Nenhuma pergunta enviada'}), 400
+    if len(questions) > AI_BATCH_MAX * 3:
+        return jsonify({'error': f'Máximo de {AI_BATCH_MAX * 3} perguntas por lote'}), 400
+    
+    if not get_ai_client():
+        return jsonify({'error': 'API do Gemini não configurada'}), 503
+    
+    try:
+        answers = answer_questions(questions)
+    except Exception as e:
+        error_message = str(e)
+        print(f"Erro ao chamar API do Gemini (lote): {error_message}")
+        answers = [ai_error_message(error_message)] * len(questions)
+    
+    return jsonify({
+        'answers': [{'question': q, 'response': a} for q, a in zip(questions, answers)]
+    }), 200
+
+# ===== RESUMO DE PASTAS (MAP-REDUCE) =====
+# Map: as notas viram unidades de até AI_SUMMARY_CHUNK_TOKENS, agrupadas em lotes resumidos
+# em paralelo (pool limitado + limite por minuto do Gemini). Cada resumo fica em cache pelo
+# hash do conteúdo, então depois de uma edição só as notas alteradas voltam ao Gemini.
+# Reduce: os resumos são combinados (em rodadas, se preciso) em um único guia de estudo.
+AI_SUMMARY_VERSION = 1  # mudar invalida o cache (novo prompt)
+AI_SUMMARY_CHUNK_TOKENS = int(os.getenv('AI_SUMMARY_CHUNK_TOKENS', 3000))
+AI_SUMMARY_WORKERS = int(os.getenv('AI_SUMMARY_WORKERS', 3))  # chamadas simultâneas por processo
+AI_SUMMARY_MAX_TOKENS = int(os.getenv('AI_SUMMARY_MAX_TOKENS', 200000))  # tamanho máximo da pasta
+AI_SUMMARY_REDUCE_ROUNDS = 3
+# Lotes do map por requisição: cabem na cota por minuto do worker (sobra uma chamada para o guia)
+AI_SUMMARY_MAX_BATCHES = max(GEMINI_RPM_PER_WORKER - 1, 1)
+
+summary_executor = ThreadPoolExecutor(max_workers=AI_SUMMARY_WORKERS, thread_name_prefix='resumo')
+
+def summary_units(notes):
+    """Uma unidade por nota (notas longas viram várias partes), com o hash do conteúdo"""
+    max_chars = AI_SUMMARY_CHUNK_TOKENS * 4
+    units = []
+    for note in notes:
+        text = (note.content or '').strip()
+        parts = [text[i:i + max_chars] for i in range(0, len(text), max_chars)] or ['']
+        for n, part in enumerate(parts, start=1):
+            label = note.title if len(parts) == 1 else f'{note.title} (parte {n}/{len(parts)})'
+            digest = hashlib.sha256(f'{AI_SUMMARY_VERSION}\n{label}\n{part}'.encode()).hexdigest()
+            units.append({'hash': digest, 'label': label, 'text': part})
+    return units
+
+def pack_by_tokens(items, cost, max_items=None):
+    """Agrupa itens em lotes de até AI_SUMMARY_CHUNK_TOKENS (e até max_items por lote)"""
+    batches, current, used = [], [], 0
+    for item in items:
+        tokens = cost(item)
+        if current and (used + tokens > AI_SUMMARY_CHUNK_TOKENS or (max_items and len(current) >= max_items)):
+            batches.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def summarize_chunk(units):
+    """Resume um lote de unidades com uma chamada ao Gemini (roda no summary_executor)"""
+    if len(units) == 1:
+        prompt = f"""Resuma a anotação de estudo abaixo em tópicos curtos (máximo 150 palavras).
+        Mantenha definições, fórmulas, datas e exemplos importantes.
+        
+        Título: {units[0]['label']}
+{units[0]['text']}"""
+        return [generate_ai_content(prompt).strip()]
+    
+    from google.genai import types
+    numbered = '\n\n'.join(f"[{i}] Título: {u['label']}\n{u['text']}" for i, u in enumerate(units, start=1))
+    prompt = f"""Resuma separadamente cada uma das {len(units)} anotações de estudo abaixo em tópicos curtos
+        (máximo 150 palavras cada), mantendo definições, fórmulas, datas e exemplos importantes.
+        Retorne SOMENTE um array JSON no formato [{{"id": <número da anotação>, "resposta": "<resumo>"}}].
+        
+        Anotações:
+{numbered}"""
+    text = generate_ai_content(prompt, config=types.GenerateContentConfig(response_mime_type='application/json'))
+    return parse_batch_answers(text, len(units))
+
+def reduce_summaries(user_id, folder_name, sections, budget):
+    """Combina os resumos em um guia de estudo com até `budget` chamadas ao Gemini.
+    Retorna (guia, chamadas); guia None se a cota acabou antes (as combinações feitas ficam no cache)"""
+    calls = 0
+    for _ in range(AI_SUMMARY_REDUCE_ROUNDS):
+        if len(sections) <= 1 or sum(estimate_tokens(s) for s in sections) <= AI_SUMMARY_CHUNK_TOKENS:
+            break
+        prompts = [
+            'Combine os resumos abaixo em um único resumo em tópicos, sem repetir informações:\n\n'
+            + '\n\n'.join(group)
+            for group in pack_by_tokens(sections, estimate_tokens)
+        ]
+        hashes = [hashlib.sha256(f"{AI_SUMMARY_VERSION}\n{prompt}".encode()).hexdigest() for prompt in prompts]
+        combined = cached_summaries(user_id, hashes)
+        missing = [i for i, digest in enumerate(hashes) if digest not in combined]
+        todo = missing[:max(budget - calls - 1, 0)]  # sobra uma chamada para o guia
+        futures = {summary_executor.submit(generate_ai_content, prompts[i]): hashes[i] for i in todo}
+        fresh = {digest: future.result() for future, digest in futures.items()}
+        calls += len(todo)
+        store_summaries(user_id, fresh)
+        if len(todo) < len(missing):
+            return None, calls
+        combined.update(fresh)
+        sections = [combined[digest] for digest in hashes]
+    
+    prompt = f"""Você é um assistente de estudos. Com base nos resumos das anotações da pasta "{folder_name}",
+        escreva um guia de estudo em português com: visão geral, tópicos principais, conceitos-chave
+        e uma lista de perguntas para revisão.
+        
+        Resumos:
+{chr(10).join(sections)}"""
+    return generate_ai_content(prompt).strip(), calls + 1
+
+def cached_summaries(user_id, hashes):
+    if not hashes:
+        return {}
+    return dict(
+        db.session.query(AISummaryCache.content_hash, AISummaryCache.summary)
+        .filter(AISummaryCache.user_id == user_id, AISummaryCache.content_hash.in_(hashes))
+    )
+
+def store_summaries(user_id, summaries):
+    if summaries:
+        db.session.execute(upsert(AISummaryCache).values([
+            {'user_id': user_id, 'content_hash': digest, 'summary': summary}
+            for digest, summary in summaries.items()
+        ]).on_conflict_do_nothing())
+        db.session.commit()
+
+@app.route('/api/folders/<int:folder_id>/summary', methods=['POST'])
+@login_required
+@limiter.limit("10 per hour")
+@admission('summary')
+def summarize_folder(folder_id):
+    """Guia de estudo da pasta inteira (map-reduce com cache por conteúdo)"""
+    user_id = session['user_id']
+    folder = Folder.query.filter_by(id=folder_id, user_id=user_id).first_or_404()
+    notes = Note.query.filter_by(folder_id=folder.id).order_by(Note.id).all()
+    if not notes:
+        return jsonify({'error': 'A pasta não tem notas'}), 400
+    if not get_ai_client():
+        return jsonify({'error': 'API do Gemini não configurada'}), 503
+    
+    units = summary_units(notes)
+    if sum(estimate_tokens(u['text']) for u in units) > AI_SUMMARY_MAX_TOKENS:
+        return jsonify({'error': 'Pasta grande demais para resumir de uma vez'}), 400
+    
+    guide_hash = hashlib.sha256(
+        f"{AI_SUMMARY_VERSION}\nguia\n{folder.name}\n".encode() + ''.join(u['hash'] for u in units).encode()
+    ).hexdigest()
+    summaries = cached_summaries(user_id, [guide_hash] + [u['hash'] for u in units])
+    stats = {'notes': len(notes), 'units': len(units), 'cached': 0, 'summarized': 0, 'remaining': 0, 'ai_calls': 0}
+    if guide_hash in summaries:
+        stats['cached'] = len(units)
+        return jsonify({'folder_id': folder.id, 'summary': summaries[guide_hash], 'stats': stats})
+    
+    # Map: só as unidades sem resumo em cache, em lotes paralelos
+    missing = [u for u in units if u['hash'] not in summaries]
+    stats['cached'] = len(units) - len(missing)
+    batches = pack_by_tokens(missing, lambda u: estimate_tokens(u['label']) + estimate_tokens(u['text']), AI_BATCH_MAX)
+    # Pasta grande: o que passar da cota do minuto fica para a próxima chamada (o feito vai para o cache)
+    pending, batches = batches[AI_SUMMARY_MAX_BATCHES:], batches[:AI_SUMMARY_MAX_BATCHES]
+    stats['remaining'] = sum(len(batch) for batch in pending)
+    futures = {summary_executor.submit(summarize_chunk, batch): batch for batch in batches}
+    fresh, errors = {}, []
+    for future in as_completed(futures):
+        try:
+            results = future.result()
+        except Exception as e:
+            errors.append(str(e))
+            continue
+        for unit, summary in zip(futures[future], results):
+            if summary:
+                fresh[unit['hash']] = summary
+    stats['ai_calls'] = len(batches)
+    stats['summarized'] = len(fresh)
+    
+    # Resumos prontos ficam salvos mesmo se algum lote falhou: a próxima tentativa é mais barata
+    store_summaries(user_id, fresh)
+    summaries.update(fresh)
+    if len(fresh) < len(missing) - stats['remaining']:
+        error_message = errors[0] if errors else 'resposta incompleta do Gemini'
+        print(f"⚠️ Resumo da pasta {folder.id}: {len(missing) - stats['remaining'] - len(fresh)} partes sem resumo ({error_message})")
+        return jsonify({'error': ai_error_message(error_message), 'stats': stats}), 503
+    if pending:
+        print(f"📚 Guia da pasta {folder.id}: {stats['summarized']} partes resumidas, {stats['remaining']} para a próxima chamada")
+        return jsonify({'folder_id': folder.id, 'partial': True, 'stats': stats}), 202
+    
+    # Reduce: guia único a partir dos resumos, na ordem das notas
+    try:
+        guide, calls = reduce_summaries(
+            user_id, folder.name, [f"## {u['label']}\n{summaries[u['hash']]}" for u in units],
+            AI_SUMMARY_MAX_BATCHES + 1 - len(batches)
+        )
+    except Exception as e:
+        print(f"Erro ao gerar guia de estudo: {e}")
+        return jsonify({'error': ai_error_message(str(e)), 'stats': stats}), 503
+    stats['ai_calls'] += calls
+    if guide is None:
+        print(f"📚 Guia da pasta {folder.id}: resumos combinados em parte, o guia fica para a próxima chamada")
+        return jsonify({'folder_id': folder.id, 'partial': True, 'stats': stats}), 202
+    store_summaries(user_id, {guide_hash: guide})
+    
+    print(f"📚 Guia da pasta {folder.id}: {stats['summarized']} partes resumidas, {stats['cached']} do cache, {stats['ai_calls']} chamadas")
+    return jsonify({'folder_id': folder.id, 'summary': guide, 'stats': stats})
 
 @app.route('/api/study-sessions/total', methods=['GET'])
 @login_required
+@read_only
 def get_total_study_time():
-    sessions = StudySession.query.filter_by(user_id=session['user_id']).all()
-    total_seconds = sum(s.duration_seconds for s in sessions)
+    hot_seconds = db.session.query(db.func.sum(StudySession.duration_seconds)).filter_by(user_id=session['user_id']).scalar()
+    archived_seconds = db.session.query(db.func.sum(StudyDailySummary.seconds)).filter_by(user_id=session['user_id']).scalar()
+    total_seconds = int(hot_seconds or 0) + int(archived_seconds or 0)
     return jsonify({'total_seconds': total_seconds})
 
 @app.route('/api/study-sessions/stats', methods=['GET'])
 @login_required
+@read_only
 def get_study_stats():
-    from datetime import datetime, timedelta
-    from sqlalchemy import func, extract
-    
-    user_id = session['user_id']
+    return jsonify(study_stats_summary(session['user_id']))
+
+def study_stats_summary(user_id):
+    """Totais de hoje/semana/mês/ano e os últimos 7 dias (2 consultas)"""
     now = datetime.now()
     
     print(f"\n=== Calculando estatísticas para user_id={user_id} ===")
     
-    # Hoje
     today_start = datetime(now.year, now.month, now.day)
-    today_sessions = StudySession.query.filter(
-        StudySession.user_id == user_id,
-        StudySession.start_time >= today_start
-    ).all()
-    today_seconds = sum(s.duration_seconds for s in today_sessions)
-    print(f"Hoje: {len(today_sessions)} sessões, {today_seconds} segundos")
-    
-    # Esta semana (segunda a domingo)
-    week_start = today_start - timedelta(days=now.weekday())
-    week_sessions = StudySession.query.filter(
-        StudySession.user_id == user_id,
-        StudySession.start_time >= week_start
-    ).all()
-    week_seconds = sum(s.duration_seconds for s in week_sessions)
-    print(f"Esta semana: {len(week_sessions)} sessões, {week_seconds} segundos")
-    
-    # Este mês
-    month_start = datetime(now.year, now.month, 1)
-    month_sessions = StudySession.query.filter(
-        StudySession.user_id == user_id,
-        StudySession.start_time >= month_start
-    ).all()
-    month_seconds = sum(s.duration_seconds for s in month_sessions)
-    print(f"Este mês: {len(month_sessions)} sessões, {month_seconds} segundos")
-    
-    # Este ano
+    week_start = today_start - timedelta(days=now.weekday())  # segunda a domingo
+    month_start_day = datetime(now.year, now.month, 1)
     year_start = datetime(now.year, 1, 1)
-    year_sessions = StudySession.query.filter(
-        StudySession.user_id == user_id,
-        StudySession.start_time >= year_start
-    ).all()
-    year_seconds = sum(s.duration_seconds for s in year_sessions)
-    print(f"Este ano: {len(year_sessions)} sessões, {year_seconds} segundos")
+    
+    # Totais por dia desde o início do ano (ou dos últimos 7 dias) em uma consulta por fonte
+    per_day = study_seconds_by_day(user_id, min(year_start, today_start - timedelta(days=6)))
+    
+    def totals_since(start):
+        sessions_count = sum(c for day, (c, _) in per_day.items() if day >= start.date())
+        seconds = sum(s for day, (_, s) in per_day.items() if day >= start.date())
+        return sessions_count, seconds
+    
+    today_count, today_seconds = totals_since(today_start)
+    print(f"Hoje: {today_count} sessões, {today_seconds} segundos")
+    week_count, week_seconds = totals_since(week_start)
+    print(f"Esta semana: {week_count} sessões, {week_seconds} segundos")
+    month_count, month_seconds = totals_since(month_start_day)
+    print(f"Este mês: {month_count} sessões, {month_seconds} segundos")
+    year_count, year_seconds = totals_since(year_start)
+    print(f"Este ano: {year_count} sessões, {year_seconds} segundos")
     
     # Últimos 7 dias (para gráfico)
     last_7_days = []
     for i in range(6, -1, -1):
         day_start = today_start - timedelta(days=i)
-        day_end = day_start + timedelta(days=1)
-        day_sessions = StudySession.query.filter(
-            StudySession.user_id == user_id,
-            StudySession.start_time >= day_start,
-            StudySession.start_time < day_end
-        ).all()
-        day_seconds = sum(s.duration_seconds for s in day_sessions)
         last_7_days.append({
             'date': day_start.strftime('%d/%m'),
-            'seconds': day_seconds
+            'seconds': per_day.get(day_start.date(), (0, 0))[1]
         })
     
-    return jsonify({
+    return {
         'today': today_seconds,
         'week': week_seconds,
         'month': month_seconds,
         'year': year_seconds,
         'last_7_days': last_7_days
+    }
+
+# ===== SINCRONIZAÇÃO INCREMENTAL =====
+@app.route('/api/sync', methods=['GET'])
+@login_required
+@read_only
+def sync_changes():
+    """Pastas, notas e tarefas alteradas/excluídas desde o cursor do cliente (since=0: tudo)"""
+    user_id = session['user_id']
+    since = max(request.args.get('since', 0, type=int), 0)
+    def sync_state():
+        return db.session.query(User.revision, User.tombstones_pruned_until).filter_by(id=user_id).first()
+    
+    state = sync_state()
+    if state is None and read_from_primary():
+        state = sync_state()
+    if state is None:
+        return jsonify({'error': 'Usuário não encontrado'}), 404
+    cursor, pruned_until = state
+    if since > cursor:
+        since = 0  # cursor de outro banco/conta: refazer sincronização completa
+    elif since < pruned_until:
+        since = 0  # exclusões desse período já foram apagadas (prune-sync-tombstones)
+    
+    folders = Folder.query.filter(Folder.user_id == user_id)
+    notes = Note.query.join(Folder).filter(Folder.user_id == user_id)
+    tasks = RoutineTask.query.filter(RoutineTask.user_id == user_id)
+    deleted = {'folders': [], 'notes': [], 'routine_tasks': []}
+    if since:
+        folders = folders.filter(Folder.revision > since)
+        notes = notes.filter(Note.revision > since)
+        tasks = tasks.filter(RoutineTask.revision > since)
+        tombstones = (
+            db.session.query(SyncTombstone.entity, SyncTombstone.entity_id)
+            .filter(SyncTombstone.user_id == user_id, SyncTombstone.revision > since)
+        )
+        for entity, entity_id in tombstones:
+            deleted[f'{entity}s'].append(entity_id)
+    
+    # Conclusões do dia não entram no sync (a tela da rotina usa /api/routine/today):
+    # marcar uma tarefa não altera a revisão dela
+    tasks = tasks.order_by(RoutineTask.order_index).all()
+    
+    return jsonify({
+        'cursor': cursor,
+        'full': since == 0,
+        'folders': [{
+            'id': f.id,
+            'name': f.name,
+            'created_at': f.created_at.isoformat()
+        } for f in folders.order_by(Folder.id)],
+        'notes': [{
+            'id': n.id,
+            'folder_id': n.folder_id,
+            'title': n.title,
+            'content': n.content,
+            'created_at': n.created_at.isoformat(),
+            'updated_at': n.updated_at.isoformat()
+        } for n in notes.order_by(Note.id)],
+        'routine_tasks': [serialize_routine_task(t) for t in tasks],
+        'deleted': deleted
     })
 
 # ===== ROTAS DE ROTINA =====
+# Ordem das tarefas: chaves com folga entre si, então mover uma tarefa altera só ela
+ROUTINE_ORDER_GAP = 1024
+
+def routine_key_between(prev_key, next_key):
+    """Chave entre duas vizinhas (None = ponta da lista); None se não houver espaço"""
+    if prev_key is None:
+        return next_key - ROUTINE_ORDER_GAP
+    if next_key is None:
+        return prev_key + ROUTINE_ORDER_GAP
+    if next_key - prev_key < 2:
+        return None
+    return (prev_key + next_key) // 2
+
+def rebalance_routine_order(user_id):
+    """Renumera as tarefas do usuário com espaçamento ROUTINE_ORDER_GAP, mantendo a ordem"""
+    task_ids = [
+        task_id for (task_id,) in db.session.query(RoutineTask.id)
+        .filter_by(user_id=user_id)
+        .order_by(RoutineTask.order_index, RoutineTask.id)
+    ]
+    if task_ids:
+        # Todas as chaves mudam: nova revisão para o /api/sync reenviar a lista inteira
+        revision = next_revision(user_id)
+        db.session.execute(db.update(RoutineTask), [
+            {'id': task_id, 'order_index': (i + 1) * ROUTINE_ORDER_GAP, 'revision': revision}
+            for i, task_id in enumerate(task_ids)
+        ])
+    return len(task_ids)
+
+@app.cli.command('rebalance-routine-order')
+@click.option('--min-gap', default=8, show_default=True, help='Renumerar usuários com vizinhas mais próximas que isso')
+def rebalance_routine_order_command(min_gap):
+    """Reabre o espaço entre as chaves de ordem da rotina (rodar periodicamente)"""
+    gap = RoutineTask.order_index - db.func.lag(RoutineTask.order_index).over(
+        partition_by=RoutineTask.user_id,
+        order_by=(RoutineTask.order_index, RoutineTask.id)
+    )
+    gaps = db.session.query(RoutineTask.user_id.label('user_id'), gap.label('gap')).subquery()
+    user_ids = [user_id for (user_id,) in db.session.query(gaps.c.user_id).filter(gaps.c.gap < min_gap).distinct()]
+    
+    for user_id in user_ids:
+        tasks = rebalance_routine_order(user_id)
+        db.session.commit()
+        print(f"↕️ Usuário {user_id}: {tasks} tarefas renumeradas")
+    print(f"✅ {len(user_ids)} usuários rebalanceados")
+
+def serialize_routine_task(task, completed=None):
+    data = {
+        'id': task.id,
+        'title': task.title,
+        'category': task.category,
+        'start_time': task.start_time,
+        'end_time': task.end_time,
+        'days': decode_days(task.days_mask),
+        'color': task.color,
+        'order_index': task.order_index
+    }
+    if completed is not None:
+        data['completed'] = completed
+    return data
+
 @app.route('/api/routine/tasks', methods=['GET'])
 @login_required
+@read_only
 def get_routine_tasks():
+    today = datetime.now().date()
     tasks = RoutineTask.query.filter_by(user_id=session['user_id']).order_by(RoutineTask.order_index).all()
-    return jsonify([{
-        'id': t.id,
-        'title': t.title,
-        'category': t.category,
-        'start_time': t.start_time,
-        'end_time': t.end_time,
-        'days': t.days.split(','),
-        'color': t.color,
-        'completed': t.completed,
-        'order_index': t.order_index
-    } for t in tasks])
+    done_today = {
+        task_id for (task_id,) in db.session.query(RoutineCompletion.task_id)
+        .join(RoutineTask)
+        .filter(RoutineTask.user_id == session['user_id'], RoutineCompletion.date == today)
+    }
+    return jsonify([serialize_routine_task(t, t.id in done_today) for t in tasks])
+
+@app.route('/api/routine/today', methods=['GET'])
+@login_required
+@read_only
+def get_routine_today():
+    """Tarefas de um dia (hoje por padrão), filtradas pela máscara no SQL"""
+    return jsonify(routine_for_date(session['user_id'], routine_date_for_day(request.args.get('day'))))
+
+def routine_for_date(user_id, target_date):
+    day_bit = 1 << target_date.weekday()
+    
+    rows = (
+        db.session.query(RoutineTask, RoutineCompletion.task_id)
+        .outerjoin(RoutineCompletion, db.and_(
+            RoutineCompletion.task_id == RoutineTask.id,
+            RoutineCompletion.date == target_date
+        ))
+        .filter(
+            RoutineTask.user_id == user_id,
+            RoutineTask.days_mask.op('&')(day_bit) != 0
+        )
+        .order_by(RoutineTask.order_index)
+        .all()
+    )
+    return {
+        'date': target_date.isoformat(),
+        'day': ROUTINE_DAYS[target_date.weekday()],
+        'tasks': [serialize_routine_task(t, done is not None) for t, done in rows]
+    }
 
 @app.route('/api/routine/tasks', methods=['POST'])
 @login_required
 def create_routine_task():
     data = request.json
+    days_mask = encode_days(data.get('days') or [])
+    if not days_mask:
+        return jsonify({'error': 'Selecione ao menos um dia válido'}), 400
     
-    # Obter o maior order_index atual
+    # Última chave de ordem do usuário (busca direta no índice user_id, order_index)
     max_order = db.session.query(db.func.max(RoutineTask.order_index)).filter_by(user_id=session['user_id']).scalar()
-    next_order = (max_order or -1) + 1
+    next_order = routine_key_between(max_order, None) if max_order is not None else ROUTINE_ORDER_GAP
     
     task = RoutineTask(
         user_id=session['user_id'],
@@ -684,10 +2481,10 @@ def create_routine_task():
         category=data['category'],
         start_time=data['start_time'],
         end_time=data['end_time'],
-        days=data['days'],
+        days_mask=days_mask,
         color=data.get('color', '#6366f1'),
-        completed=False,
-        order_index=next_order
+        order_index=next_order,
+        revision=next_revision(session['user_id'])
     )
     db.session.add(task)
     db.session.commit()
@@ -701,12 +2498,17 @@ def update_routine_task(task_id):
         return jsonify({'error': 'Não autorizado'}), 403
     
     data = request.json
+    if 'days' in data:
+        days_mask = encode_days(data['days'] or [])
+        if not days_mask:
+            return jsonify({'error': 'Selecione ao menos um dia válido'}), 400
+        task.days_mask = days_mask
     task.title = data.get('title', task.title)
     task.category = data.get('category', task.category)
     task.start_time = data.get('start_time', task.start_time)
     task.end_time = data.get('end_time', task.end_time)
-    task.days = data.get('days', task.days)
     task.color = data.get('color', task.color)
+    task.revision = next_revision(task.user_id)
     
     db.session.commit()
     return jsonify({'success': True})
@@ -718,10 +2520,66 @@ def delete_routine_task(task_id):
     if task.user_id != session['user_id']:
         return jsonify({'error': 'Não autorizado'}), 403
     
+    add_tombstones(task.user_id, 'routine_task', [task.id], next_revision(task.user_id))
+    RoutineCompletion.query.filter_by(task_id=task.id).delete(synchronize_session=False)
     db.session.delete(task)
     db.session.commit()
     return jsonify({'success': True})
 
+@app.route('/api/routine/tasks/<int:task_id>/move', methods=['POST'])
+@login_required
+def move_routine_task(task_id):
+    """Coloca a tarefa entre after_id e before_id alterando só a chave dela"""
+    task = RoutineTask.query.get_or_404(task_id)
+    if task.user_id != session['user_id']:
+        return jsonify({'error': 'Não autorizado'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    after_id, before_id = data.get('after_id'), data.get('before_id')
+    neighbor_ids = [i for i in (after_id, before_id) if i is not None]
+    if not neighbor_ids:
+        return jsonify({'error': 'Informe after_id ou before_id'}), 400
+    if task.id in neighbor_ids:
+        return jsonify({'error': 'A tarefa não pode ser vizinha de si mesma'}), 400
+    
+    def neighbor_keys():
+        keys = dict(
+            db.session.query(RoutineTask.id, RoutineTask.order_index)
+            .filter(RoutineTask.user_id == task.user_id, RoutineTask.id.in_(neighbor_ids))
+        )
+        if len(keys) != len(neighbor_ids):
+            return None
+        prev_key, next_key = keys.get(after_id), keys.get(before_id)
+        
+        # Só um vizinho informado: o outro lado é a tarefa adjacente de verdade
+        # (uma busca no índice user_id, order_index), senão a chave nova pode empatar com ela
+        others = db.session.query(RoutineTask.order_index).filter(
+            RoutineTask.user_id == task.user_id, RoutineTask.id != task.id
+        )
+        if next_key is None:
+            next_key = others.filter(RoutineTask.order_index > prev_key).order_by(RoutineTask.order_index).limit(1).scalar()
+        elif prev_key is None:
+            prev_key = others.filter(RoutineTask.order_index < next_key).order_by(RoutineTask.order_index.desc()).limit(1).scalar()
+        return prev_key, next_key
+    
+    keys = neighbor_keys()
+    if keys is None:
+        return jsonify({'error': 'Tarefa vizinha não encontrada'}), 404
+    
+    new_key = routine_key_between(*keys)
+    if new_key is None:
+        # Sem espaço entre as vizinhas (raro): renumerar a lista e tentar de novo
+        rebalance_routine_order(task.user_id)
+        new_key = routine_key_between(*neighbor_keys())
+        if new_key is None:
+            db.session.rollback()
+            return jsonify({'error': 'after_id precisa vir antes de before_id'}), 400
+    
+    task.revision = next_revision(task.user_id)
+    task.order_index = new_key  # depois da revisão: sai em um único UPDATE
+    db.session.commit()
+    return jsonify({'success': True, 'order_index': new_key})
+
 @app.route('/api/routine/tasks/<int:task_id>/toggle', methods=['POST'])
 @login_required
 def toggle_task_completion(task_id):
@@ -729,9 +2587,29 @@ def toggle_task_completion(task_id):
     if task.user_id != session['user_id']:
         return jsonify({'error': 'Não autorizado'}), 403
     
-    task.completed = not task.completed
+    data = request.get_json(silent=True) or {}
+    target_date = routine_date_for_day(data.get('day'))
+    completion = db.session.get(RoutineCompletion, (task.id, target_date))
+    if completion:
+        db.session.delete(completion)
+    else:
+        db.session.add(RoutineCompletion(task_id=task.id, date=target_date))
     db.session.commit()
-    return jsonify({'success': True, 'completed': task.completed})
+    return jsonify({'success': True, 'completed': completion is None, 'date': target_date.isoformat()})
+
+@app.route('/api/routine/reset', methods=['POST'])
+@login_required
+def reset_routine_day():
+    """Remove as marcações de um dia em uma única instrução"""
+    data = request.get_json(silent=True) or {}
+    target_date = routine_date_for_day(data.get('day'))
+    task_ids = db.session.query(RoutineTask.id).filter(RoutineTask.user_id == session['user_id'])
+    RoutineCompletion.query.filter(
+        RoutineCompletion.date == target_date,
+        RoutineCompletion.task_id.in_(task_ids)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return jsonify({'success': True, 'date': target_date.isoformat()})
 
 @app.route('/api/routine/initialize', methods=['POST'])
 @login_required
@@ -742,6 +2620,7 @@ def initialize_routine():
         return jsonify({'message': 'Cronograma já existe'}), 200
     
     # Criar cronograma padrão
+    revision = next_revision(session['user_id'])
     default_tasks = [
         {'title': 'Acordar e tomar café da manhã', 'category': 'alimentação', 'start_time': '07:00', 'end_time': '07:30', 'color': '#f59e0b', 'order': 0},
         {'title': 'Sessão de estudos manhã', 'category': 'estudo', 'start_time': '08:00', 'end_time': '10:00', 'color': '#6366f1', 'order': 1},
@@ -765,10 +2644,10 @@ def initialize_routine():
             category=task_data['category'],
             start_time=task_data['start_time'],
             end_time=task_data['end_time'],
-            days='segunda,terça,quarta,quinta,sexta,sábado,domingo',
+            days_mask=ALL_DAYS_MASK,
             color=task_data['color'],
-            order_index=task_data['order'],
-            completed=False
+            order_index=(task_data['order'] + 1) * ROUTINE_ORDER_GAP,
+            revision=revision
         )
         db.session.add(task)
     
@@ -788,6 +2667,7 @@ def internal_server_error(e):
 # ===== SISTEMA DE RECUPERAÇÃO DE SENHA =====
 @app.route('/api/forgot-password', methods=['POST'])
 @limiter.limit("3 per hour")
+@admission('mail')
 def forgot_password():
     """Gera token de recuperação de senha"""
     try:
@@ -816,6 +2696,7 @@ def forgot_password():
         email_sent = False
         if app.config['MAIL_USERNAME'] and app.config['MAIL_PASSWORD']:
             try:
+                from flask_mail import Message
                 msg = Message(
                     'Recuperação de Senha - BNStudy',
                     recipients=[user.email]
@@ -866,7 +2747,7 @@ Equipe BNStudy
 </body>
 </html>
 '''
-                mail.send(msg)
+                get_mail().send(msg)
                 email_sent = True
                 print(f"✅ Email enviado para: {user.email}")
             except Exception as email_error:
@@ -927,10 +2808,16 @@ def reset_password():
 # ===== EXPORTAÇÃO DE DADOS =====
 @app.route('/api/export/notes', methods=['GET'])
 @login_required
+@admission('export')
+@read_only
 def export_notes():
     """Exporta todas as notas do usuário em JSON"""
     try:
-        folders = Folder.query.filter_by(user_id=session['user_id']).all()
+        folders = Folder.query.filter_by(user_id=session['user_id']).order_by(Folder.id).all()
+        notes_by_folder = {}
+        notes = Note.query.join(Folder).filter(Folder.user_id == session['user_id']).order_by(Note.id)
+        for note in notes:
+            notes_by_folder.setdefault(note.folder_id, []).append(note)
         export_data = {
             'user': {
                 'name': session['user_name'],
@@ -947,7 +2834,7 @@ def export_notes():
                 'notes': []
             }
             
-            for note in folder.notes:
+            for note in notes_by_folder.get(folder.id, []):
                 folder_data['notes'].append({
                     'title': note.title,
                     'content': note.content,
@@ -964,6 +2851,8 @@ def export_notes():
 
 @app.route('/api/export/stats', methods=['GET'])
 @login_required
+@admission('export')
+@read_only
 def export_stats():
     """Exporta estatísticas de estudo do usuário"""
     try:
@@ -973,6 +2862,12 @@ def export_stats():
             .order_by(StudySession.start_time.desc())
             .all()
         )
+        archived = (
+            StudyDailySummary.query
+            .filter_by(user_id=session['user_id'])
+            .order_by(StudyDailySummary.date.desc())
+            .all()
+        )
         
         export_data = {
             'user': {
@@ -980,9 +2875,10 @@ def export_stats():
                 'email': session['user_email']
             },
             'exported_at': datetime.utcnow().isoformat(),
-            'total_sessions': len(sessions),
-            'total_time_seconds': sum(s.duration_seconds for s in sessions),
-            'sessions': []
+            'total_sessions': len(sessions) + sum(a.sessions for a in archived),
+            'total_time_seconds': sum(s.duration_seconds for s in sessions) + sum(a.seconds for a in archived),
+            'sessions': [],
+            'archived_days': []
         }
         
         for session_record in sessions:
@@ -999,11 +2895,272 @@ def export_stats():
                 'duration_formatted': f"{hours}h {minutes}min {seconds}s"
             })
         
+        # Períodos arquivados só têm o total por dia
+        for summary in archived:
+            export_data['archived_days'].append({
+                'date': summary.date.isoformat(),
+                'sessions': summary.sessions,
+                'duration_seconds': summary.seconds
+            })
+        
         return jsonify(export_data)
     except Exception as e:
         print(f"❌ Erro ao exportar estatísticas: {e}")
         return jsonify({'error': 'Erro ao exportar dados'}), 500
 
+# ===== IMPORTAÇÃO DE DADOS =====
+IMPORT_BATCH_SIZE = 1000  # notas por INSERT (executemany) e por transação
+
+class JSONStreamReader:
+    """Leitura incremental de JSON: decodifica um valor por vez sem carregar o arquivo inteiro"""
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self._json = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.bytes_read = 0
+
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self._stream.read(self.CHUNK_SIZE)
+        if chunk:
+            self.bytes_read += len(chunk)
+            text = self._decoder.decode(chunk)
+        else:
+            self.eof = True
+            text = self._decoder.decode(b'', final=True)
+        # Descartar o que já foi consumido para manter o buffer pequeno
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Próximo caractere não-branco (None no fim do arquivo)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return None
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"JSON inválido: esperado '{char}'")
+        self.pos += 1
+
+    def value(self):
+        """Decodifica o próximo valor completo (lendo mais dados se necessário)"""
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self.buffer, self.pos)
+                # Um número no fim do buffer pode continuar no próximo bloco
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise ValueError('JSON inválido ou incompleto')
+            self._fill()
+
+    def _separator(self, closing):
+        char = self.peek()
+        self.pos += 1
+        if char == closing:
+            return False
+        if char != ',':
+            raise ValueError(f"JSON inválido: esperado ',' ou '{closing}'")
+        return True
+
+    def iter_object(self):
+        """Gera as chaves de um objeto; o chamador deve consumir o valor de cada uma"""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if not self._separator('}'):
+                return
+
+    def iter_array(self):
+        """Gera uma vez por elemento; o chamador deve consumir cada elemento"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            if not self._separator(']'):
+                return
+
+def iter_export_json(reader):
+    """Registros ('folder', dict) / ('note', dict) do formato de /api/export/notes"""
+    for key in reader.iter_object():
+        if key != 'folders':
+            reader.value()
+            continue
+        for _ in reader.iter_array():
+            folder = {}
+            has_notes = False
+            for folder_key in reader.iter_object():
+                if folder_key == 'notes':
+                    has_notes = True
+                    yield 'folder', folder
+                    for _ in reader.iter_array():
+                        yield 'note', reader.value()
+                else:
+                    folder[folder_key] = reader.value()
+            if not has_notes:
+                yield 'folder', folder
+
+def iter_export_ndjson(reader):
+    """NDJSON: uma pasta do export por linha, ou uma nota por linha com o campo 'folder'"""
+    while reader.peek() is not None:
+        record = reader.value()
+        if not isinstance(record, dict):
+            raise ValueError('NDJSON inválido: cada linha deve ser um objeto')
+        if 'title' in record:
+            yield 'note', record
+        else:
+            yield 'folder', {k: v for k, v in record.items() if k != 'notes'}
+            for note in record.get('notes') or []:
+                yield 'note', note
+
+def parse_export_datetime(value):
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '').replace('+00:00', ''))
+    except (TypeError, ValueError):
+        return datetime.utcnow()
+
+def import_notes_stream(user_id, stream, fmt='json', progress=None):
+    """Importa pastas/notas em lotes de IMPORT_BATCH_SIZE, com commit por lote"""
+    reader = JSONStreamReader(stream)
+    records = iter_export_ndjson(reader) if fmt == 'ndjson' else iter_export_json(reader)
+    
+    # Pastas com o mesmo nome são reaproveitadas
+    folder_ids = {name: folder_id for folder_id, name in db.session.query(Folder.id, Folder.name).filter_by(user_id=user_id)}
+    stats = {'folders': 0, 'notes': 0}
+    batch = []
+    current_folder_id = None
+    
+    def folder_id_for(name, created_at=None):
+        name = str(name or '').strip()[:100] or 'Importadas'
+        if name not in folder_ids:
+            folder = Folder(
+                name=name,
+                user_id=user_id,
+                created_at=parse_export_datetime(created_at),
+                revision=next_revision(user_id)
+            )
+            db.session.add(folder)
+            db.session.flush()
+            folder_ids[name] = folder.id
+            stats['folders'] += 1
+        return folder_ids[name]
+    
+    def flush():
+        if batch:
+            revision = next_revision(user_id)
+            for row in batch:
+                row['revision'] = revision
+            db.session.execute(db.insert(Note), batch)  # executemany
+            stats['notes'] += len(batch)
+            batch.clear()
+        db.session.commit()
+        if progress:
+            progress(stats, reader.bytes_read)
+    
+    for kind, record in records:
+        if kind == 'folder':
+            current_folder_id = folder_id_for(record.get('name'), record.get('created_at'))
+            continue
+        if not isinstance(record, dict):
+            raise ValueError('Nota inválida no arquivo')
+        if 'folder' in record:
+            folder_id = folder_id_for(record['folder'])
+        else:
+            folder_id = current_folder_id or folder_id_for(None)
+        created_at = parse_export_datetime(record.get('created_at'))
+        batch.append({
+            'title': str(record.get('title') or 'Sem título')[:200],
+            'content': record.get('content') or '',
+            'folder_id': folder_id,
+            'created_at': created_at,
+            'updated_at': parse_export_datetime(record.get('updated_at') or created_at)
+        })
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            flush()
+    flush()
+    return stats
+
+def import_format(filename, content_type, requested=None):
+    if requested in ('json', 'ndjson'):
+        return requested
+    if (filename or '').lower().endswith(('.ndjson', '.jsonl')) or 'ndjson' in (content_type or ''):
+        return 'ndjson'
+    return 'json'
+
+@app.route('/api/import/notes', methods=['POST'])
+@login_required
+@limiter.limit("10 per hour")
+@admission('export')
+def import_notes():
+    """Importa o JSON de /api/export/notes (ou NDJSON) enviado como arquivo ou no corpo"""
+    upload = request.files.get('file')
+    if upload:
+        stream = upload.stream
+        fmt = import_format(upload.filename, upload.mimetype, request.args.get('format'))
+    else:
+        stream = request.stream
+        fmt = import_format(None, request.content_type, request.args.get('format'))
+    
+    started = time.monotonic()
+    try:
+        stats = import_notes_stream(session['user_id'], stream, fmt)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Erro ao importar notas: {e}")
+        return jsonify({'success': False, 'message': 'Erro ao importar dados'}), 500
+    
+    print(f"📥 Importação: {stats['folders']} pastas, {stats['notes']} notas em {time.monotonic() - started:.1f}s")
+    return jsonify({'success': True, **stats})
+
+@app.cli.command('import-notes')
+@click.argument('email')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['json', 'ndjson']), default=None)
+def import_notes_command(email, path, fmt):
+    """Importa um export de notas (JSON ou NDJSON) para a conta EMAIL"""
+    user = User.query.filter_by(email=email.strip().lower()).first()
+    if not user:
+        raise click.ClickException(f'Usuário não encontrado: {email}')
+    
+    total_bytes = os.path.getsize(path) or 1
+    started = time.monotonic()
+    
+    def progress(stats, bytes_read):
+        print(f"⏳ {bytes_read * 100 // total_bytes:3d}% - {stats['notes']} notas, {stats['folders']} pastas")
+    
+    with open(path, 'rb') as f:
+        stats = import_notes_stream(user.id, f, import_format(path, None, fmt), progress)
+    print(f"✅ {stats['notes']} notas e {stats['folders']} pastas importadas em {time.monotonic() - started:.1f}s")
+
 if __name__ == '__main__':
     debug_mode = os.getenv('DEBUG', 'False').lower() == 'true'
+    # Em desenvolvimento, criar/migrar tabelas automaticamente
+    with app.app_context():
+        db.create_all()
+        migrate_schema()
     app.run(debug=debug_mode, host='0.0.0.0', port=5000)
@@ -0,0 +1,59 @@
+"""
+Benchmark do tempo de inicialização de um worker
+Mede, em processos novos, quanto tempo leva o `import app` e confirma
+que os módulos pesados (Gemini, Flask-Mail, numpy) só carregam no primeiro uso.
+
+Uso: python bench_startup.py [repetições]
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ['google.genai', 'flask_mail', 'requests', 'numpy']
+
+PROBE = '''
+import sys, time
+t0 = time.perf_counter()
+import app
+elapsed = time.perf_counter() - t0
+loaded = [m for m in {heavy!r} if m in sys.modules]
+print(f"{{elapsed:.6f}}|{{','.join(loaded)}}")
+'''
+
+
+def measure_once():
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite://')
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE.format(heavy=HEAVY_MODULES)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    elapsed, loaded = result.stdout.strip().splitlines()[-1].split('|')
+    return float(elapsed), [m for m in loaded.split(',') if m]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    timings = []
+    loaded = []
+    for _ in range(runs):
+        elapsed, loaded = measure_once()
+        timings.append(elapsed)
+
+    print(f"⏱️  import app ({runs} execuções)")
+    print(f"   mediana: {statistics.median(timings) * 1000:.1f} ms")
+    print(f"   mínimo:  {min(timings) * 1000:.1f} ms")
+    print(f"   máximo:  {max(timings) * 1000:.1f} ms")
+    if loaded:
+        print(f"⚠️  Módulos pesados carregados no import: {', '.join(loaded)}")
+    else:
+        print("✅ Nenhum módulo pesado carregado no import")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 """
-Script para recriar o banco de dados
-Use quando adicionar novos campos aos modelos
+Script para recriar o banco de dados do ZERO (apaga todos os dados!)
+Para atualizar o esquema de um banco existente use: flask --app app init-db
 """
 from app import db, app
 
@@ -2,13 +2,18 @@
 REM Script de inicialização para produção com Gunicorn (Windows)
 
 SET WORKERS=4
+REM O app divide GEMINI_RPM (cota da conta) entre os workers
+SET WEB_CONCURRENCY=%WORKERS%
+REM O app confere que as rotas lentas deixam threads livres para o CRUD
+SET THREADS=16
+SET WEB_THREADS=%THREADS%
 SET PORT=5000
 SET TIMEOUT=120
 
 IF NOT EXIST logs mkdir logs
 
 echo 🚀 Iniciando BNStudy em modo produção...
-echo 📊 Workers: %WORKERS%
+echo 📊 Workers: %WORKERS% x %THREADS% threads
 echo 🔌 Porta: %PORT%
 
 REM Ativar ambiente virtual se existir
@@ -16,9 +21,13 @@ IF EXIST venv\Scripts\activate.bat (
     call venv\Scripts\activate.bat
 )
 
-REM Executar Gunicorn
+REM Criar tabelas (não acontece mais no import do app)
+flask --app app init-db
+
+REM Executar Gunicorn (--preload: workers nascem de um processo já aquecido)
 gunicorn ^
     --workers %WORKERS% ^
+    --threads %THREADS% ^
     --bind 0.0.0.0:%PORT% ^
     --timeout %TIMEOUT% ^
     --access-logfile logs/access.log ^
@@ -3,6 +3,13 @@
 
 # Número de workers (recomendado: 2-4 x número de CPUs)
 WORKERS=4
+# O app divide GEMINI_RPM (cota da conta) entre os workers
+export WEB_CONCURRENCY=$WORKERS
+
+# Threads por worker; o app confere que as rotas lentas (ADMISSION_*_LIMIT/_QUEUE)
+# deixam ADMISSION_CRUD_RESERVE delas livres para o CRUD
+THREADS=16
+export WEB_THREADS=$THREADS
 
 # Porta
 PORT=5000
@@ -18,7 +25,7 @@ ERROR_LOG="logs/error.log"
 mkdir -p logs
 
 echo "🚀 Iniciando BNStudy em modo produção..."
-echo "📊 Workers: $WORKERS"
+echo "📊 Workers: $WORKERS x $THREADS threads"
 echo "🔌 Porta: $PORT"
 
 # Ativar ambiente virtual se existir
@@ -26,9 +33,13 @@ if [ -d "venv" ]; then
     source venv/bin/activate
 fi
 
-# Executar Gunicorn
+# Criar tabelas (não acontece mais no import do app)
+flask --app app init-db
+
+# Executar Gunicorn (--preload: workers nascem de um processo já aquecido)
 gunicorn \
     --workers $WORKERS \
+    --threads $THREADS \
     --bind 0.0.0.0:$PORT \
     --timeout $TIMEOUT \
     --access-logfile $ACCESS_LOG \
@@ -1,6 +1,7 @@
 // ===== INICIALIZAÇÃO =====
 document.addEventListener('DOMContentLoaded', () => {
     loadUsers();
+    loadAnalytics();
     setupEventListeners();
 });
 
@@ -67,6 +68,21 @@ function updateStats() {
     document.getElementById('totalRegularUsers').textContent = totalRegularUsers;
 }
 
+// ===== MÉTRICAS DA PLATAFORMA =====
+async function loadAnalytics() {
+    try {
+        const response = await fetch('/api/admin/analytics?days=30');
+        if (!response.ok) throw new Error('Erro ao carregar métricas');
+        
+        const data = await response.json();
+        document.getElementById('activeToday').textContent = data.today.active_users;
+        document.getElementById('studyHours30d').textContent = `${Math.round(data.period.study_seconds / 3600)}h`;
+        document.getElementById('notesToday').textContent = data.today.notes_created;
+    } catch (error) {
+        console.error('Erro:', error);
+    }
+}
+
 // ===== RENDERIZAR USUÁRIOS =====
 function renderUsers(users) {
     const tbody = document.getElementById('usersTableBody');
@@ -193,7 +209,7 @@ async function executeDelete() {
         const data = await response.json();
         
         if (data.success) {
-            showNotification('Usuário deletado com sucesso!', 'success');
+            showNotification(data.message || 'Usuário deletado com sucesso!', 'success');
             await loadUsers();
         } else {
             showNotification(data.message || 'Erro ao deletar usuário', 'error');
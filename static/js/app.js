@@ -10,6 +10,45 @@ let lastSavedSeconds = 0;
 let folderToDelete = null;
 let loadingCount = 0; // Contador de operações em andamento
 
+// Cópia local de pastas, notas e tarefas mantida pelo /api/sync (só baixa o que mudou)
+const syncStore = {
+    cursor: 0,
+    folders: new Map(),
+    notes: new Map(),
+    routineTasks: new Map()
+};
+let syncQueue = Promise.resolve();
+
+// Dados iniciais renderizados junto com a página (pastas com contagem, rotina de hoje, estatísticas)
+const bootstrapElement = document.getElementById('bootstrapData');
+const bootstrapData = bootstrapElement ? JSON.parse(bootstrapElement.textContent) : null;
+
+async function fetchChanges() {
+    const response = await fetch(`/api/sync?since=${syncStore.cursor}`);
+    if (!response.ok) throw new Error('Erro ao sincronizar');
+    const data = await response.json();
+    
+    if (data.full) {
+        syncStore.folders.clear();
+        syncStore.notes.clear();
+        syncStore.routineTasks.clear();
+    }
+    data.folders.forEach(folder => syncStore.folders.set(folder.id, folder));
+    data.notes.forEach(note => syncStore.notes.set(note.id, note));
+    data.routine_tasks.forEach(task => syncStore.routineTasks.set(task.id, task));
+    data.deleted.folders.forEach(id => syncStore.folders.delete(id));
+    data.deleted.notes.forEach(id => syncStore.notes.delete(id));
+    data.deleted.routine_tasks.forEach(id => syncStore.routineTasks.delete(id));
+    syncStore.cursor = data.cursor;
+}
+
+function syncChanges() {
+    // Sincronizações em fila: cada uma parte do cursor deixado pela anterior
+    const run = syncQueue.then(fetchChanges);
+    syncQueue = run.catch(() => {});
+    return run;
+}
+
 // ===== LOADING GLOBAL =====
 function showGlobalLoading(message = 'Carregando...') {
     loadingCount++;
@@ -77,8 +116,19 @@ document.addEventListener('DOMContentLoaded', () => {
 });
 
 function initializeApp() {
-    loadFolders();
     setupEventListeners();
+    
+    if (bootstrapData) {
+        // Primeira tela montada sem requisições; o /api/sync roda ao abrir uma pasta
+        bootstrapData.folders.forEach(folder => syncStore.folders.set(folder.id, folder));
+        renderFolders();
+        renderStudyStats(bootstrapData.stats);
+        // Se houver sessão pendente, o timer salva e recarrega as estatísticas
+        loadStudyTimer();
+        return;
+    }
+    
+    loadFolders();
     // Aguardar carregar timer (pode salvar sessão pendente)
     loadStudyTimer().then(() => {
         // Depois carregar estatísticas
@@ -166,21 +216,8 @@ function setupEventListeners() {
 async function loadFolders() {
     showGlobalLoading('Carregando pastas...');
     try {
-        const response = await fetch('/api/folders');
-        const folders = await response.json();
-        
-        const foldersList = document.getElementById('foldersList');
-        foldersList.innerHTML = '';
-        
-        if (folders.length === 0) {
-            foldersList.innerHTML = '<p style="text-align: center; color: var(--text-secondary); padding: 1rem;">Nenhuma pasta criada</p>';
-            return;
-        }
-        
-        folders.forEach(folder => {
-            const folderElement = createFolderElement(folder);
-            foldersList.appendChild(folderElement);
-        });
+        await syncChanges();
+        renderFolders();
     } catch (error) {
         console.error('❌ Erro ao carregar pastas:', error);
         showToast('Erro ao carregar pastas', 'error');
@@ -189,7 +226,43 @@ async function loadFolders() {
     }
 }
 
-function createFolderElement(folder) {
+function renderFolders() {
+    const folders = [...syncStore.folders.values()];
+    
+    const foldersList = document.getElementById('foldersList');
+    foldersList.innerHTML = '';
+    
+    if (folders.length === 0) {
+        foldersList.innerHTML = '<p style="text-align: center; color: var(--text-secondary); padding: 1rem;">Nenhuma pasta criada</p>';
+        return;
+    }
+    
+    const counts = folderNoteCounts();
+    folders.forEach(folder => {
+        const folderElement = createFolderElement(folder, counts.get(folder.id) || 0);
+        foldersList.appendChild(folderElement);
+    });
+}
+
+// Notas por pasta: a contagem do bootstrap vale até o primeiro /api/sync trazer as notas
+function folderNoteCounts() {
+    const counts = new Map();
+    if (!syncStore.cursor) {
+        syncStore.folders.forEach(folder => counts.set(folder.id, folder.notes_count || 0));
+        return counts;
+    }
+    syncStore.notes.forEach(note => counts.set(note.folder_id, (counts.get(note.folder_id) || 0) + 1));
+    return counts;
+}
+
+function updateFolderCounts() {
+    const counts = folderNoteCounts();
+    document.querySelectorAll('.folder-item').forEach(item => {
+        item.querySelector('.folder-count').textContent = counts.get(Number(item.dataset.folderId)) || 0;
+    });
+}
+
+function createFolderElement(folder, notesCount) {
     const div = document.createElement('div');
     div.className = 'folder-item';
     div.dataset.folderId = folder.id;
@@ -198,6 +271,7 @@ function createFolderElement(folder) {
         <div class="folder-info">
             <i class="fas fa-folder"></i>
             <span>${folder.name}</span>
+            <span class="folder-count" title="Notas na pasta">${notesCount}</span>
         </div>
         <div class="folder-actions">
             <button class="btn-delete" onclick="deleteFolder(${folder.id})">
@@ -272,6 +346,7 @@ async function selectFolder(folderId, folderName) {
     document.getElementById('currentFolderName').textContent = folderName;
     const addNoteBtn = document.getElementById('addNoteBtn');
     addNoteBtn.disabled = false;
+    document.getElementById('summarizeFolderBtn').disabled = false;
     console.log('Botão addNote habilitado:', addNoteBtn);
     
     // Mostrar painel da IA ao lado
@@ -291,8 +366,9 @@ async function selectFolder(folderId, folderName) {
 // ===== NOTAS =====
 async function loadNotes(folderId) {
     try {
-        const response = await fetch(`/api/folders/${folderId}/notes`);
-        const notes = await response.json();
+        await syncChanges();
+        updateFolderCounts();
+        const notes = [...syncStore.notes.values()].filter(note => note.folder_id === folderId);
         
         const notesGrid = document.getElementById('notesGrid');
         notesGrid.innerHTML = '';
@@ -354,11 +430,13 @@ function openNoteModal(note = null) {
         modalTitle.textContent = 'Editar Nota';
         titleInput.value = note.title;
         contentInput.value = note.content || '';
+        loadRelatedNotes(note.id);
     } else {
         currentNoteId = null;
         modalTitle.textContent = 'Nova Nota';
         titleInput.value = '';
         contentInput.value = '';
+        document.getElementById('relatedNotes').style.display = 'none';
     }
     
     modal.classList.add('active');
@@ -374,6 +452,37 @@ function openNoteModal(note = null) {
     startAutoSaveForNewNote();
 }
 
+// Notas parecidas de qualquer pasta (calculadas no servidor, sem IA)
+async function loadRelatedNotes(noteId) {
+    const container = document.getElementById('relatedNotes');
+    if (!container) return;
+    container.style.display = 'none';
+    container.innerHTML = '';
+    try {
+        const response = await fetch(`/api/notes/${noteId}/related?k=5`);
+        if (!response.ok || currentNoteId !== noteId) return;
+        const related = await response.json();
+        if (related.length === 0) return;
+        
+        container.innerHTML = '<strong><i class="fas fa-link"></i> Notas relacionadas</strong>';
+        related.forEach(item => {
+            const link = document.createElement('a');
+            link.href = '#';
+            link.style.display = 'block';
+            link.textContent = `${item.title} (${item.folder_name})`;
+            link.addEventListener('click', (e) => {
+                e.preventDefault();
+                const target = syncStore.notes.get(item.id);
+                if (target) openNoteModal(target);
+            });
+            container.appendChild(link);
+        });
+        container.style.display = 'block';
+    } catch (error) {
+        console.error('Erro ao carregar notas relacionadas:', error);
+    }
+}
+
 function closeNoteModal() {
     document.getElementById('noteModal').classList.remove('active');
     currentNoteId = null;
@@ -734,12 +843,7 @@ async function loadStudyStats() {
         if (response.ok) {
             const data = await response.json();
             console.log('Estatísticas recebidas:', data);
-            
-            // Formatar e exibir estatísticas
-            document.getElementById('statToday').textContent = formatTime(data.today);
-            document.getElementById('statWeek').textContent = formatTime(data.week);
-            document.getElementById('statMonth').textContent = formatTime(data.month);
-            document.getElementById('statYear').textContent = formatTime(data.year);
+            renderStudyStats(data);
         } else {
             console.error('Erro ao carregar estatísticas:', response.status);
         }
@@ -748,6 +852,14 @@ async function loadStudyStats() {
     }
 }
 
+// Formatar e exibir estatísticas
+function renderStudyStats(data) {
+    document.getElementById('statToday').textContent = formatTime(data.today);
+    document.getElementById('statWeek').textContent = formatTime(data.week);
+    document.getElementById('statMonth').textContent = formatTime(data.month);
+    document.getElementById('statYear').textContent = formatTime(data.year);
+}
+
 // Formatar segundos para horas e minutos
 // Formatar segundos para horas e minutos
 function formatTime(seconds) {
@@ -802,8 +914,8 @@ async function sendAiMessage() {
         // Remover indicador de digitação
         typingIndicator.remove();
         
-        // Adicionar resposta da IA
-        addAiMessage(data.response, 'assistant');
+        // Adicionar resposta da IA (503 = servidor ocupado, vem em data.error)
+        addAiMessage(data.response || data.error, 'assistant');
         
     } catch (error) {
         console.error('Erro ao enviar mensagem:', error);
@@ -818,6 +930,36 @@ async function sendAiMessage() {
     }
 }
 
+// Guia de estudo da pasta inteira (resumos em cache: só notas alteradas voltam à IA)
+async function summarizeFolder() {
+    if (!currentFolderId) return;
+    const button = document.getElementById('summarizeFolderBtn');
+    button.disabled = true;
+    showGlobalLoading('Gerando guia de estudo...');
+    try {
+        const response = await fetch(`/api/folders/${currentFolderId}/summary`, { method: 'POST' });
+        const data = await response.json();
+        if (!response.ok) {
+            showToast(data.error || 'Erro ao resumir pasta', 'error');
+            return;
+        }
+        if (data.partial) {
+            // Pasta grande: cada chamada resume o que cabe na cota do Gemini por minuto
+            const done = data.stats.units - data.stats.remaining;
+            showToast(`${done} de ${data.stats.units} partes resumidas. Clique de novo em 1 minuto para continuar.`, 'info');
+            return;
+        }
+        document.querySelector('.right-panel')?.classList.add('show');
+        addAiMessage(data.summary, 'assistant');
+    } catch (error) {
+        console.error('Erro ao resumir pasta:', error);
+        showToast('Erro ao resumir pasta', 'error');
+    } finally {
+        hideGlobalLoading();
+        button.disabled = false;
+    }
+}
+
 function addAiMessage(text, type) {
     const messagesContainer = document.getElementById('aiMessages');
     const messageDiv = document.createElement('div');
@@ -1143,12 +1285,17 @@ window.alternarView = function(view) {
     const addNoteBtn = document.getElementById('addNoteBtn');
     const addTaskBtn = document.getElementById('addTaskBtn');
     
+    const summarizeBtn = document.getElementById('summarizeFolderBtn');
+    const importBtn = document.getElementById('importNotesBtn');
+    
     if (view === 'notas') {
         notasView.style.display = 'block';
         rotinaView.style.display = 'none';
         notasTab.classList.add('active');
         rotinaTab.classList.remove('active');
         addNoteBtn.style.display = 'flex';
+        summarizeBtn.style.display = 'flex';
+        importBtn.style.display = 'flex';
         addTaskBtn.style.display = 'none';
     } else if (view === 'rotina') {
         notasView.style.display = 'none';
@@ -1156,6 +1303,8 @@ window.alternarView = function(view) {
         notasTab.classList.remove('active');
         rotinaTab.classList.add('active');
         addNoteBtn.style.display = 'none';
+        summarizeBtn.style.display = 'none';
+        importBtn.style.display = 'none';
         addTaskBtn.style.display = 'flex';
         carregarTarefas();
     }
@@ -1163,6 +1312,11 @@ window.alternarView = function(view) {
 
 // Event listeners da rotina
 document.addEventListener('DOMContentLoaded', () => {
+    // Rotina começa no dia de hoje (vindo do servidor)
+    if (bootstrapData && bootstrapData.routine) {
+        currentRoutineDay = bootstrapData.routine.day;
+        marcarDiaAtivo(currentRoutineDay);
+    }
     // Inicializar view de notas
     alternarView('notas');
 });
@@ -1177,7 +1331,11 @@ function fecharModalRotina() {
 
 function selecionarDia(dia) {
     currentRoutineDay = dia;
-    
+    marcarDiaAtivo(dia);
+    carregarTarefas();
+}
+
+function marcarDiaAtivo(dia) {
     // Atualizar botões ativos
     document.querySelectorAll('.day-btn').forEach(btn => {
         btn.classList.remove('active');
@@ -1186,15 +1344,22 @@ function selecionarDia(dia) {
     if (selectedBtn) {
         selectedBtn.classList.add('active');
     }
-    
-    renderizarCronograma();
 }
 
 async function carregarTarefas() {
+    // Primeira abertura: usar a rotina de hoje que veio com a página (só uma vez)
+    if (bootstrapData && bootstrapData.routine && bootstrapData.routine.day === currentRoutineDay) {
+        window.routineTasks = bootstrapData.routine.tasks;
+        bootstrapData.routine = null;
+        renderizarCronograma();
+        return;
+    }
+    
     try {
-        const response = await fetch('/api/routine/tasks');
-        const tasks = await response.json();
-        window.routineTasks = tasks;
+        // O servidor já filtra as tarefas do dia e traz a conclusão da data
+        const response = await fetch(`/api/routine/today?day=${encodeURIComponent(currentRoutineDay)}`);
+        const data = await response.json();
+        window.routineTasks = data.tasks;
         renderizarCronograma();
     } catch (error) {
         console.error('Erro ao carregar tarefas:', error);
@@ -1207,10 +1372,8 @@ function renderizarCronograma() {
     const emptySchedule = document.getElementById('emptySchedule');
     const tasks = window.routineTasks || [];
     
-    // Filtrar tarefas do dia atual
-    const dayTasks = tasks.filter(task => 
-        task.days.includes(currentRoutineDay)
-    ).sort((a, b) => a.order_index - b.order_index);
+    // Tarefas já vêm filtradas pelo dia selecionado
+    const dayTasks = [...tasks].sort((a, b) => a.order_index - b.order_index);
     
     if (dayTasks.length === 0) {
         scheduleList.style.display = 'none';
@@ -1248,6 +1411,12 @@ function renderizarCronograma() {
             </div>
             
             <div class="schedule-actions">
+                <button class="schedule-btn" onclick="moverTarefa(${task.id}, -1)" title="Subir">
+                    <i class="fas fa-arrow-up"></i>
+                </button>
+                <button class="schedule-btn" onclick="moverTarefa(${task.id}, 1)" title="Descer">
+                    <i class="fas fa-arrow-down"></i>
+                </button>
                 <button class="schedule-btn" onclick="editarTarefa(${task.id})" title="Editar">
                     <i class="fas fa-edit"></i>
                 </button>
@@ -1262,7 +1431,9 @@ function renderizarCronograma() {
 async function toggleTarefaConcluida(taskId) {
     try {
         const response = await fetch(`/api/routine/tasks/${taskId}/toggle`, {
-            method: 'POST'
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ day: currentRoutineDay })
         });
         
         if (response.ok) {
@@ -1286,14 +1457,11 @@ async function resetarCronograma() {
     }
     
     try {
-        const tasks = window.routineTasks || [];
-        const dayTasks = tasks.filter(task => task.days.includes(currentRoutineDay) && task.completed);
-        
-        for (const task of dayTasks) {
-            await fetch(`/api/routine/tasks/${task.id}/toggle`, {
-                method: 'POST'
-            });
-        }
+        await fetch('/api/routine/reset', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ day: currentRoutineDay })
+        });
         
         await carregarTarefas();
         showNotification('Cronograma resetado!', 'success');
@@ -1458,6 +1626,32 @@ function editarTarefa(taskId) {
     abrirFormTarefa(taskId);
 }
 
+async function moverTarefa(taskId, direcao) {
+    const tasks = [...(window.routineTasks || [])].sort((a, b) => a.order_index - b.order_index);
+    const index = tasks.findIndex(task => task.id === taskId);
+    const target = index + direcao;
+    if (index < 0 || target < 0 || target >= tasks.length) return;
+    
+    // O servidor só altera a tarefa movida: basta dizer entre quais vizinhas ela fica
+    const after = direcao < 0 ? tasks[target - 1] : tasks[target];
+    const before = direcao < 0 ? tasks[target] : tasks[target + 1];
+    try {
+        const response = await fetch(`/api/routine/tasks/${taskId}/move`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                after_id: after ? after.id : null,
+                before_id: before ? before.id : null
+            })
+        });
+        if (!response.ok) throw new Error('Erro ao mover tarefa');
+        await carregarTarefas();
+    } catch (error) {
+        console.error('Erro ao mover tarefa:', error);
+        showNotification('Erro ao mover tarefa', 'error');
+    }
+}
+
 async function excluirTarefa(taskId) {
     if (!confirm('Deseja realmente excluir esta atividade?')) {
         return;
@@ -1547,3 +1741,41 @@ async function exportStats() {
         hideGlobalLoading();
     }
 }
+
+async function importNotes(file) {
+    showGlobalLoading('Importando notas...');
+    try {
+        const formData = new FormData();
+        formData.append('file', file);
+        
+        const response = await fetch('/api/import/notes', {
+            method: 'POST',
+            body: formData
+        });
+        const data = await response.json();
+        
+        if (!response.ok || !data.success) {
+            throw new Error(data.message || 'Erro ao importar notas');
+        }
+        
+        await loadFolders();
+        showToast(`${data.notes} notas importadas em ${data.folders} novas pastas!`, 'success');
+    } catch (error) {
+        console.error('❌ Erro ao importar notas:', error);
+        showToast(error.message || 'Erro ao importar notas', 'error');
+    } finally {
+        hideGlobalLoading();
+    }
+}
+
+window.importNotesFromInput = function(input) {
+    const file = input.files[0];
+    input.value = '';  // permite escolher o mesmo arquivo de novo
+    if (!file) return;
+    
+    if (file.size > Number(input.dataset.maxBytes)) {
+        showToast('Arquivo grande demais para enviar pelo navegador. Use o comando import-notes no servidor.', 'error');
+        return;
+    }
+    importNotes(file);
+}
@@ -0,0 +1,231 @@
+"""
+Fixtures dos testes: banco SQLite temporário, dados de exemplo e o
+QueryRecorder, que conta as consultas SQL e as linhas lidas por requisição.
+
+Uso: python -m pytest -q
+"""
+import json
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+# O app lê o banco no import: apontar para um arquivo temporário antes de importar
+_tmp_dir = tempfile.mkdtemp(prefix='bnstudy-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmp_dir, 'test.db')}"
+os.environ.pop('DATABASE_REPLICA_URL', None)
+os.environ['GEMINI_API_KEY'] = ''
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+
+PASSWORD = '123456'
+# Hash barato: os testes medem consultas, não o custo do pbkdf2
+PASSWORD_HASH = app_module.generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')
+
+SEED_FOLDERS = 6
+SEED_NOTES_PER_FOLDER = 5
+SEED_STUDY_DAYS = 20
+SEED_ROUTINE_TASKS = 12
+SEED_CHAT_MESSAGES = 10
+SEED_OTHER_USERS = 5
+
+
+class QueryRecorder:
+    """Registra os comandos SQL e as linhas lidas enquanto estiver ativo"""
+
+    def __init__(self, engine, session_class):
+        self.engine = engine
+        self.session_class = session_class
+        self.statements = []
+        self.rows = 0
+
+    def __enter__(self):
+        self.statements = []
+        self.rows = 0
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        event.listen(self.session_class, 'do_orm_execute', self._on_orm_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+        event.remove(self.session_class, 'do_orm_execute', self._on_orm_execute)
+        return False
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def _on_orm_execute(self, orm_execute_state):
+        # SELECTs: materializar o resultado para contar as linhas e devolver uma cópia
+        if not orm_execute_state.is_select:
+            return None
+        frozen = orm_execute_state.invoke_statement().freeze()
+        self.rows += len(frozen.data)
+        return frozen()
+
+    def report(self):
+        return '\n'.join(f'  {i + 1}. {" ".join(s.split())}' for i, s in enumerate(self.statements))
+
+
+def seed_database(db, models):
+    """Dataset de referência: um aluno com dados em todas as áreas, um admin e outros usuários"""
+    User, Folder, Note = models.User, models.Folder, models.Note
+    now = datetime.utcnow()
+
+    student = User(name='Aluno', email='aluno@teste.com', password_hash=PASSWORD_HASH)
+    admin = User(name='Admin', email='admin@teste.com', password_hash=PASSWORD_HASH, is_admin=True)
+    others = [
+        User(name=f'Outro {i}', email=f'outro{i}@teste.com', password_hash=PASSWORD_HASH)
+        for i in range(SEED_OTHER_USERS)
+    ]
+    db.session.add_all([student, admin, *others])
+    db.session.flush()
+
+    revision = 0
+    folders = []
+    for i in range(SEED_FOLDERS):
+        revision += 1
+        folder = Folder(name=f'Pasta {i}', user_id=student.id, revision=revision)
+        db.session.add(folder)
+        folders.append(folder)
+    for other in others:
+        db.session.add(Folder(name='Pasta', user_id=other.id))
+    db.session.flush()
+
+    notes = []
+    for folder in folders:
+        for j in range(SEED_NOTES_PER_FOLDER):
+            revision += 1
+            note = Note(title=f'Nota {j}', content='Conteúdo de estudo ' * 20,
+                        folder_id=folder.id, revision=revision)
+            db.session.add(note)
+            notes.append(note)
+
+    for day in range(SEED_STUDY_DAYS):
+        start = now - timedelta(days=day, hours=1)
+        db.session.add(models.StudySession(
+            user_id=student.id, start_time=start,
+            end_time=start + timedelta(minutes=30), duration_seconds=1800
+        ))
+
+    tasks = []
+    for i in range(SEED_ROUTINE_TASKS):
+        revision += 1
+        task = models.RoutineTask(
+            user_id=student.id, title=f'Tarefa {i}', category='estudo',
+            start_time='08:00', end_time='09:00', order_index=(i + 1) * models.ROUTINE_ORDER_GAP,
+            revision=revision
+        )
+        db.session.add(task)
+        tasks.append(task)
+    db.session.flush()
+    for task in tasks[:3]:
+        db.session.add(models.RoutineCompletion(task_id=task.id, date=datetime.now().date()))
+
+    for i in range(SEED_CHAT_MESSAGES):
+        db.session.add(models.ChatMessage(
+            user_id=student.id, role='user' if i % 2 == 0 else 'assistant',
+            content=f'Mensagem {i}', tokens=3
+        ))
+
+    for day in range(30):
+        db.session.add(models.PlatformDailyStats(
+            date=now.date() - timedelta(days=day), active_users=3, new_users=1,
+            study_sessions=2, study_seconds=3600, notes_created=4
+        ))
+
+    db.session.add(models.PlatformCounter(name='users', value=2 + SEED_OTHER_USERS))
+    student.revision = revision
+    student.reset_token = 'token-de-teste'
+    student.reset_token_expires = now + timedelta(hours=1)
+    db.session.commit()
+
+    return {
+        'student_id': student.id,
+        'admin_id': admin.id,
+        'other_user_id': others[0].id,
+        'folder_id': folders[0].id,
+        'note_id': notes[0].id,
+        'task_id': tasks[0].id,
+        'middle_task_id': tasks[5].id,
+        'next_task_id': tasks[6].id
+    }
+
+
+class FakeAIResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeAIClient:
+    """Substitui o Gemini: responde na hora, sem rede (e conta as chamadas)"""
+    calls = 0
+
+    class models:
+        @staticmethod
+        def generate_content(model, contents, config=None):
+            FakeAIClient.calls += 1
+            # Prompts em lote pedem um array JSON com um item por "[n]"
+            ids = re.findall(r'^\[(\d+)\]', contents, re.M)
+            if config is not None and ids:
+                return FakeAIResponse(json.dumps([{'id': int(i), 'resposta': f'Resumo {i}'} for i in ids]))
+            return FakeAIResponse('Resposta de teste')
+
+
+@pytest.fixture
+def app():
+    app_module.app.config['TESTING'] = True
+    app_module.app.config['MAIL_USERNAME'] = ''
+    app_module.limiter.enabled = False
+    app_module._ai_client = FakeAIClient()
+    app_module.gemini_rate_limiter = app_module.GeminiRateLimiter(app_module.GEMINI_RPM_PER_WORKER)  # cota nova por teste
+    FakeAIClient.calls = 0
+    yield app_module.app
+
+
+@pytest.fixture
+def seed(app):
+    with app.app_context():
+        app_module.db.drop_all()
+        app_module.db.create_all()
+        app_module._active_seen.clear()
+        app_module._related_indexes.clear()
+        ids = seed_database(app_module.db, app_module)
+        app_module.db.session.remove()
+    return ids
+
+
+def logged_client(app, user_id, name, email, is_admin=False):
+    """Cliente com a sessão que o /login criaria (sem gastar consultas no login)"""
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['user_name'] = name
+        sess['user_email'] = email
+        sess['is_admin'] = is_admin
+    return client
+
+
+@pytest.fixture
+def student_client(app, seed):
+    return logged_client(app, seed['student_id'], 'Aluno', 'aluno@teste.com')
+
+
+@pytest.fixture
+def admin_client(app, seed):
+    return logged_client(app, seed['admin_id'], 'Admin', 'admin@teste.com', is_admin=True)
+
+
+@pytest.fixture
+def query_recorder(app):
+    with app.app_context():
+        engine = app_module.db.engine
+    return QueryRecorder(engine, app_module.RoutingSession)
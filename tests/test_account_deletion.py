@@ -0,0 +1,37 @@
+"""
+Exclusão de contas: sessões abertas da conta param de escrever e o cron conclui exclusões interrompidas.
+"""
+from datetime import datetime, timedelta
+
+from conftest import app_module
+
+
+def mark_for_deletion(app, user_id, minutes_ago=0):
+    with app.app_context():
+        user = app_module.db.session.get(app_module.User, user_id)
+        user.deletion_requested_at = datetime.utcnow() - timedelta(minutes=minutes_ago)
+        app_module.db.session.commit()
+
+
+def test_session_of_account_being_deleted_cannot_write(app, student_client, seed):
+    mark_for_deletion(app, seed['student_id'])
+
+    response = student_client.post('/api/notes', json={'folder_id': seed['folder_id'], 'title': 'x', 'content': 'y'})
+    assert response.status_code == 401
+    with student_client.session_transaction() as sess:
+        assert 'user_id' not in sess
+
+
+def test_purge_deleted_users_skips_deletions_still_running(app, seed):
+    mark_for_deletion(app, seed['student_id'])
+    runner = app.test_cli_runner()
+
+    assert runner.invoke(args=['purge-deleted-users', '--minutes', '30']).exit_code == 0
+    with app.app_context():
+        assert app_module.db.session.get(app_module.User, seed['student_id']) is not None
+
+    mark_for_deletion(app, seed['student_id'], minutes_ago=31)
+    result = runner.invoke(args=['purge-deleted-users', '--minutes', '30'])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert app_module.db.session.get(app_module.User, seed['student_id']) is None
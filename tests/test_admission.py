@@ -0,0 +1,85 @@
+"""
+Controle de admissão: classes lentas saturadas descartam com 503 e o CRUD segue atendido.
+"""
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from conftest import app_module, logged_client
+
+
+class BlockedBatcher:
+    """Segura as perguntas do /api/chat até o teste liberar (simula o Gemini lento)"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.submitted = threading.Semaphore(0)
+
+    def submit(self, question, key=None):
+        future = Future()
+        self.submitted.release()
+
+        def answer():
+            self.release.wait(10)
+            future.set_result('ok')
+        threading.Thread(target=answer, daemon=True).start()
+        return future
+
+
+def test_saturated_chat_is_shed_while_crud_is_served(app, seed, monkeypatch):
+    chat = app_module.admission_classes['chat']
+    batcher = BlockedBatcher()
+    monkeypatch.setattr(app_module, 'ai_batcher', batcher)
+    monkeypatch.setattr(chat, 'max_wait', 5)  # a fila espera o teste liberar as vagas
+    shed_before = chat.stats()['shed']
+
+    def ask(i):
+        client = logged_client(app, seed['student_id'], 'Aluno', 'aluno@teste.com')
+        results[i] = client.post('/api/chat', json={'message': f'pergunta {i}'}).status_code
+
+    # Ocupa todas as vagas e a fila da classe
+    results = {}
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(chat.limit + chat.queue_size)]
+    try:
+        for thread in threads:
+            thread.start()
+        for _ in range(chat.limit):
+            assert batcher.submitted.acquire(timeout=5)
+        while chat.stats()['queued'] < chat.queue_size:
+            threading.Event().wait(0.01)
+
+        client = logged_client(app, seed['student_id'], 'Aluno', 'aluno@teste.com')
+        response = client.post('/api/chat', json={'message': 'mais uma'})
+        assert response.status_code == 503
+        assert int(response.headers['Retry-After']) == chat.retry_after()
+        assert chat.stats()['shed'] == shed_before + 1
+
+        # O CRUD não disputa as threads da classe
+        note = client.post('/api/notes', json={'folder_id': seed['folder_id'], 'title': 'Autosave', 'content': 'x'})
+        assert note.status_code == 201
+    finally:
+        batcher.release.set()
+        for thread in threads:
+            thread.join(10)
+    assert list(results.values()) == [200] * len(threads)
+    assert chat.stats()['active'] == 0
+
+
+def test_queued_request_is_shed_after_max_wait():
+    admission_class = app_module.AdmissionClass('teste', limit=1, queue_size=1, max_wait=0.05)
+    assert admission_class.acquire()
+
+    assert not admission_class.acquire()
+    stats = admission_class.stats()
+    assert stats['shed_timeout'] == 1 and stats['shed'] == 1
+    admission_class.release()
+    assert admission_class.acquire()
+
+
+def test_admission_budget_must_leave_threads_for_crud():
+    classes = app_module.admission_classes
+    used = app_module.check_admission_budget(classes, app_module.WEB_THREADS, app_module.ADMISSION_CRUD_RESERVE)
+    assert used <= app_module.WEB_THREADS - app_module.ADMISSION_CRUD_RESERVE
+    with pytest.raises(RuntimeError):
+        app_module.check_admission_budget(classes, threads=8, reserve=app_module.ADMISSION_CRUD_RESERVE)
@@ -0,0 +1,28 @@
+"""
+Micro-lotes do /api/chat: perguntas de usuários diferentes com histórico não dividem um prompt.
+"""
+import threading
+
+from conftest import app_module
+
+
+def test_batches_are_split_by_key(monkeypatch):
+    batches = []
+    lock = threading.Lock()
+
+    def fake_answer_questions(questions):
+        with lock:
+            batches.append(sorted(questions))
+        return [f'resposta {q}' for q in questions]
+
+    monkeypatch.setattr(app_module, 'answer_questions', fake_answer_questions)
+    batcher = app_module.AIMicroBatcher(window=0.2, max_size=8)
+    futures = [
+        batcher.submit('historico aluno 1', key=1),
+        batcher.submit('historico aluno 2', key=2),
+        batcher.submit('sem contexto a'),
+        batcher.submit('sem contexto b'),
+    ]
+
+    assert [f.result(timeout=5) for f in futures][0] == 'resposta historico aluno 1'
+    assert sorted(batches) == [['historico aluno 1'], ['historico aluno 2'], ['sem contexto a', 'sem contexto b']]
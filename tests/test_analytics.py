@@ -0,0 +1,38 @@
+"""
+Analytics da plataforma: total de contas e usuários ativos do dia.
+"""
+from datetime import datetime
+
+from conftest import app_module
+
+
+def all_time_users(admin_client):
+    return admin_client.get('/api/admin/analytics').get_json()['all_time']['users']
+
+
+def test_all_time_users_follows_signups_and_deletions(app, admin_client, seed):
+    # Banco anterior aos contadores: init-db preenche a partir da tabela de usuários
+    with app.app_context():
+        app_module.PlatformCounter.query.delete()
+        app_module.db.session.commit()
+        app_module.ensure_platform_counters()
+    assert all_time_users(admin_client) == 2 + 5
+
+    app.test_client().post('/register', json={'name': 'Nova', 'email': 'nova@teste.com', 'password': '123456'})
+    assert all_time_users(admin_client) == 2 + 5 + 1
+    admin_client.delete(f"/api/admin/users/{seed['other_user_id']}")
+
+    assert all_time_users(admin_client) == 2 + 5
+
+
+def test_rolled_back_activity_is_recorded_again(app, seed):
+    key = (datetime.utcnow().date(), seed['student_id'])
+    with app.app_context():
+        app_module.record_activity(seed['student_id'])
+        app_module.db.session.rollback()
+        assert key not in app_module._active_seen
+
+        app_module.record_activity(seed['student_id'])
+        app_module.db.session.commit()
+        assert key in app_module._active_seen
+        assert app_module.db.session.get(app_module.DailyActiveUser, (key[0], key[1])) is not None
@@ -0,0 +1,53 @@
+"""
+Memória da conversa do /api/chat com perguntas simultâneas do mesmo usuário.
+"""
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from conftest import SEED_CHAT_MESSAGES, app_module, logged_client
+
+
+class PairedBatcher:
+    """Só responde quando as duas perguntas estão em andamento ao mesmo tempo"""
+
+    def __init__(self):
+        self.barrier = threading.Barrier(2, timeout=10)
+
+    def submit(self, question, key=None):
+        future = Future()
+
+        def answer():
+            self.barrier.wait()
+            future.set_result('ok')
+        threading.Thread(target=answer, daemon=True).start()
+        return future
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_concurrent_questions_from_user_without_memory(app, seed, monkeypatch, compact):
+    monkeypatch.setattr(app_module, 'ai_batcher', PairedBatcher())
+    if compact:
+        # Janela recente de 2 mensagens: as 8 restantes viram o primeiro resumo
+        monkeypatch.setattr(app_module, 'AI_MEMORY_BUDGET', app_module.AI_MEMORY_SUMMARY_TOKENS + 6)
+        monkeypatch.setattr(app_module, 'AI_MEMORY_COMPACT_AFTER', 10)
+
+    responses = {}
+
+    def ask(i):
+        client = logged_client(app, seed['student_id'], 'Aluno', 'aluno@teste.com')
+        responses[i] = client.post('/api/chat', json={'message': f'pergunta {i}'}).get_json()['response']
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(15)
+
+    assert responses == {0: 'ok', 1: 'ok'}
+    with app.app_context():
+        messages = app_module.ChatMessage.query.filter_by(user_id=seed['student_id']).count()
+        assert messages == SEED_CHAT_MESSAGES + 4
+        memory = app_module.db.session.get(app_module.ChatMemory, seed['student_id'])
+        assert (memory is not None) == compact
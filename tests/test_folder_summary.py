@@ -0,0 +1,71 @@
+"""
+Resumo de pastas: map-reduce no Gemini com cache por conteúdo (/api/folders/<id>/summary).
+"""
+from conftest import FakeAIClient, SEED_NOTES_PER_FOLDER, app_module
+
+
+def summarize(client, folder_id):
+    response = client.post(f'/api/folders/{folder_id}/summary')
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.get_json()
+
+
+def test_folder_summary_map_reduce(student_client, seed):
+    data = summarize(student_client, seed['folder_id'])
+
+    assert data['summary'] == 'Resposta de teste'
+    assert data['stats']['summarized'] == SEED_NOTES_PER_FOLDER
+    assert data['stats']['cached'] == 0
+    # Notas pequenas: um lote no map + o guia no reduce
+    assert data['stats']['ai_calls'] == FakeAIClient.calls == 2
+
+
+def test_folder_summary_reuses_cached_chunks(student_client, seed):
+    summarize(student_client, seed['folder_id'])
+
+    unchanged = summarize(student_client, seed['folder_id'])
+    assert unchanged['stats']['ai_calls'] == 0
+
+    student_client.put(f"/api/notes/{seed['note_id']}", json={'title': 'Nota 0', 'content': 'conteúdo novo'})
+    edited = summarize(student_client, seed['folder_id'])
+    assert edited['stats']['summarized'] == 1
+    assert edited['stats']['cached'] == SEED_NOTES_PER_FOLDER - 1
+
+
+def test_folder_summary_of_another_user(admin_client, seed):
+    assert admin_client.post(f"/api/folders/{seed['folder_id']}/summary").status_code == 404
+
+
+def test_large_folder_is_summarized_across_calls(student_client, seed, monkeypatch):
+    # Uma nota por lote e cota de 2 lotes por chamada
+    monkeypatch.setattr(app_module, 'AI_BATCH_MAX', 1)
+    monkeypatch.setattr(app_module, 'AI_SUMMARY_MAX_BATCHES', 2)
+    url = f"/api/folders/{seed['folder_id']}/summary"
+
+    remaining = []
+    response = student_client.post(url)
+    while response.status_code == 202:
+        data = response.get_json()
+        assert data['partial'] and data['stats']['ai_calls'] == 2
+        remaining.append(data['stats']['remaining'])
+        response = student_client.post(url)
+
+    assert response.status_code == 200
+    assert remaining == [SEED_NOTES_PER_FOLDER - 2, SEED_NOTES_PER_FOLDER - 4]
+    assert response.get_json()['stats']['cached'] == SEED_NOTES_PER_FOLDER - 1
+
+
+def test_every_call_stays_within_the_per_minute_budget(student_client, seed, monkeypatch):
+    # Lotes pequenos forçam várias rodadas de combinação no reduce
+    monkeypatch.setattr(app_module, 'AI_SUMMARY_CHUNK_TOKENS', 50)
+    monkeypatch.setattr(app_module, 'AI_SUMMARY_MAX_BATCHES', 2)
+    monkeypatch.setattr(app_module, 'gemini_rate_limiter', app_module.GeminiRateLimiter(1000))
+    url = f"/api/folders/{seed['folder_id']}/summary"
+
+    for _ in range(10):
+        response = student_client.post(url)
+        assert response.get_json()['stats']['ai_calls'] <= 3
+        if response.status_code != 202:
+            break
+    assert response.status_code == 200
+    assert response.get_json()['summary'] == 'Resposta de teste'
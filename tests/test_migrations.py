@@ -0,0 +1,59 @@
+"""
+init-db em um banco criado pela versão anterior (esquema do database/estudante.db original).
+"""
+from datetime import datetime
+
+from conftest import app_module
+
+LEGACY_SCHEMA = [
+    """CREATE TABLE user (id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, email VARCHAR(120) NOT NULL,
+        password_hash VARCHAR(255) NOT NULL, is_admin BOOLEAN, reset_token VARCHAR(100),
+        reset_token_expires DATETIME, created_at DATETIME, PRIMARY KEY (id), UNIQUE (email))""",
+    """CREATE TABLE folder (id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, user_id INTEGER NOT NULL,
+        created_at DATETIME, PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id))""",
+    """CREATE TABLE note (id INTEGER NOT NULL, title VARCHAR(200) NOT NULL, content TEXT,
+        folder_id INTEGER NOT NULL, created_at DATETIME, updated_at DATETIME, PRIMARY KEY (id),
+        FOREIGN KEY(folder_id) REFERENCES folder (id))""",
+    """CREATE TABLE study_session (id INTEGER NOT NULL, user_id INTEGER NOT NULL, start_time DATETIME NOT NULL,
+        end_time DATETIME, duration_seconds INTEGER, created_at DATETIME, PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES user (id))""",
+    """CREATE TABLE routine_task (id INTEGER NOT NULL, user_id INTEGER NOT NULL, title VARCHAR(200) NOT NULL,
+        category VARCHAR(50) NOT NULL, start_time VARCHAR(5) NOT NULL, end_time VARCHAR(5) NOT NULL,
+        days VARCHAR(50) NOT NULL, color VARCHAR(7), completed BOOLEAN, order_index INTEGER,
+        created_at DATETIME, PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id))""",
+    "INSERT INTO user (id, name, email, password_hash, is_admin) VALUES (1, 'Aluno', 'aluno@teste.com', 'x', 1)",
+    "INSERT INTO folder (id, name, user_id) VALUES (1, 'Biologia', 1)",
+    "INSERT INTO note (id, title, content, folder_id) VALUES (1, 'Mitose', 'texto', 1)",
+    """INSERT INTO routine_task (id, user_id, title, category, start_time, end_time, days, completed, order_index)
+        VALUES (1, 1, 'Estudar', 'estudo', '08:00', '09:00', 'segunda,quarta', 1, 0),
+               (2, 1, 'Academia', 'academia', '18:00', '19:00', 'sábado', 0, 1)""",
+]
+
+
+def test_init_db_migrates_legacy_database(app):
+    db = app_module.db
+    with app.app_context():
+        db.drop_all()
+        with db.engine.begin() as conn:
+            for statement in LEGACY_SCHEMA:
+                conn.exec_driver_sql(statement)
+
+        for _ in range(2):  # a segunda execução não pode alterar nada
+            db.create_all()
+            app_module.migrate_schema()
+
+        tasks = dict(db.session.query(app_module.RoutineTask.id, app_module.RoutineTask.days_mask))
+        assert tasks == {1: app_module.encode_days('segunda,quarta'), 2: app_module.encode_days('sábado')}
+        completions = db.session.query(app_module.RoutineCompletion.task_id, app_module.RoutineCompletion.date).all()
+        assert completions == [(1, datetime.now().date())]
+
+        inspector = db.inspect(db.engine)
+        assert {'days', 'completed'}.isdisjoint(c['name'] for c in inspector.get_columns('routine_task'))
+        assert inspector.get_foreign_keys('note')[0]['options'] == {'ondelete': 'CASCADE'}
+
+        # ON DELETE CASCADE: apagar o usuário leva pastas e notas
+        db.session.execute(db.text('DELETE FROM user WHERE id = 1'))
+        db.session.commit()
+        assert db.session.query(app_module.Note).count() == 0
+        db.session.remove()
+        db.drop_all()
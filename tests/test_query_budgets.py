@@ -0,0 +1,132 @@
+"""
+Orçamento de consultas por rota.
+
+Cada rota do app.py roda uma vez contra o dataset de conftest.seed_database
+e não pode passar do número de comandos SQL nem do número de linhas lidas
+definidos abaixo. Um N+1 (ex.: len(folder.notes) dentro de um loop) estoura
+o orçamento porque o dataset tem várias pastas, notas e dias de estudo.
+
+Rota nova sem orçamento faz test_every_route_has_a_budget falhar.
+"""
+import json
+from collections import namedtuple
+
+import pytest
+
+Case = namedtuple('Case', 'endpoint method url client body status max_queries max_rows')
+
+IMPORT_PAYLOAD = json.dumps({'folders': [
+    {'name': 'Importada', 'notes': [{'title': f'Nota {i}', 'content': 'texto'} for i in range(20)]}
+]})
+
+ROUTE_BUDGETS = [
+    # Páginas
+    Case('login_page', 'GET', '/', 'anon', None, 200, 0, 0),
+    Case('index', 'GET', '/app', 'student', None, 200, 5, 39),
+    Case('admin_page', 'GET', '/admin', 'admin', None, 200, 1, 1),
+    # Admin
+    Case('get_all_users', 'GET', '/api/admin/users', 'admin', None, 200, 2, 8),
+    Case('get_platform_analytics', 'GET', '/api/admin/analytics', 'admin', None, 200, 4, 33),
+    Case('get_admission_stats', 'GET', '/api/admin/admission', 'admin', None, 200, 1, 1),
+    Case('delete_user', 'DELETE', '/api/admin/users/{other_user_id}', 'admin', None, 200, 18, 4),
+    Case('toggle_admin', 'POST', '/api/admin/users/{other_user_id}/toggle-admin', 'admin', None, 200, 4, 3),
+    # Autenticação
+    Case('register', 'POST', '/register', 'anon',
+         {'name': 'Novo', 'email': 'novo@teste.com', 'password': '123456'}, 200, 7, 2),
+    Case('login', 'POST', '/login', 'anon', {'email': 'aluno@teste.com', 'password': '123456'}, 200, 4, 2),
+    Case('logout', 'GET', '/logout', 'student', None, 302, 0, 0),
+    Case('forgot_password', 'POST', '/api/forgot-password', 'anon', {'email': 'aluno@teste.com'}, 200, 2, 1),
+    Case('reset_password', 'POST', '/api/reset-password', 'anon',
+         {'token': 'token-de-teste', 'password': 'nova-senha'}, 200, 3, 2),
+    # Pastas e notas
+    Case('get_folders', 'GET', '/api/folders', 'student', None, 200, 1, 6),
+    Case('create_folder', 'POST', '/api/folders', 'student', {'name': 'Nova pasta'}, 201, 4, 2),
+    Case('delete_folder', 'DELETE', '/api/folders/{folder_id}', 'student', None, 204, 12, 7),
+    Case('summarize_folder', 'POST', '/api/folders/{folder_id}/summary', 'student', None, 200, 8, 9),
+    Case('get_notes', 'GET', '/api/folders/{folder_id}/notes', 'student', None, 200, 2, 6),
+    Case('create_note', 'POST', '/api/notes', 'student',
+         {'folder_id': '{folder_id}', 'title': 'Nova', 'content': 'texto'}, 201, 7, 3),
+    Case('update_note', 'PUT', '/api/notes/{note_id}', 'student', {'title': 'Editada', 'content': 'novo'}, 200, 9, 4),
+    Case('get_related_notes', 'GET', '/api/notes/{note_id}/related', 'student', None, 200, 7, 67),
+    Case('delete_note', 'DELETE', '/api/notes/{note_id}', 'student', None, 204, 6, 3),
+    Case('sync_changes', 'GET', '/api/sync?since=0', 'student', None, 200, 4, 49),
+    # Sessões de estudo
+    Case('get_study_sessions', 'GET', '/api/study-sessions', 'student', None, 200, 1, 10),
+    Case('create_study_session', 'POST', '/api/study-sessions', 'student',
+         {'start_time': '2026-01-05T10:00:00Z', 'end_time': '2026-01-05T10:30:00Z', 'duration_seconds': 1800},
+         201, 5, 2),
+    Case('get_total_study_time', 'GET', '/api/study-sessions/total', 'student', None, 200, 2, 2),
+    Case('get_study_stats', 'GET', '/api/study-sessions/stats', 'student', None, 200, 2, 20),
+    # Assistente
+    Case('chat_with_ai', 'POST', '/api/chat', 'student', {'message': 'O que é mitose?'}, 200, 6, 11),
+    Case('get_chat_history', 'GET', '/api/chat/history', 'student', None, 200, 1, 10),
+    Case('clear_chat_history', 'DELETE', '/api/chat/history', 'student', None, 204, 3, 1),
+    Case('chat_batch', 'POST', '/api/chat/batch', 'student', {'questions': ['O que é DNA?', 'O que é RNA?']},
+         200, 1, 1),
+    # Rotina
+    Case('get_routine_tasks', 'GET', '/api/routine/tasks', 'student', None, 200, 2, 15),
+    Case('get_routine_today', 'GET', '/api/routine/today', 'student', None, 200, 1, 12),
+    Case('create_routine_task', 'POST', '/api/routine/tasks', 'student',
+         {'title': 'Revisar', 'category': 'estudo', 'start_time': '10:00', 'end_time': '11:00',
+          'days': ['segunda', 'quarta']}, 201, 5, 3),
+    Case('update_routine_task', 'PUT', '/api/routine/tasks/{task_id}', 'student',
+         {'title': 'Revisar mais', 'days': ['terça']}, 200, 5, 2),
+    Case('delete_routine_task', 'DELETE', '/api/routine/tasks/{task_id}', 'student', None, 200, 6, 2),
+    Case('move_routine_task', 'POST', '/api/routine/tasks/{task_id}/move', 'student',
+         {'after_id': '{middle_task_id}', 'before_id': '{next_task_id}'}, 200, 5, 4),
+    Case('toggle_task_completion', 'POST', '/api/routine/tasks/{task_id}/toggle', 'student', {}, 200, 4, 3),
+    Case('reset_routine_day', 'POST', '/api/routine/reset', 'student', {}, 200, 2, 1),
+    Case('initialize_routine', 'POST', '/api/routine/initialize', 'student', None, 200, 2, 2),
+    # Exportação e importação
+    Case('export_notes', 'GET', '/api/export/notes', 'student', None, 200, 2, 36),
+    Case('export_stats', 'GET', '/api/export/stats', 'student', None, 200, 2, 20),
+    Case('import_notes', 'POST', '/api/import/notes', 'student', IMPORT_PAYLOAD, 200, 6, 7),
+]
+
+
+def fill_ids(value, seed):
+    if isinstance(value, str):
+        return value.format(**seed) if '{' in value and not value.startswith('{"') else value
+    if isinstance(value, dict):
+        filled = {k: fill_ids(v, seed) for k, v in value.items()}
+        return {k: int(v) if k.endswith('_id') and isinstance(v, str) and v.isdigit() else v
+                for k, v in filled.items()}
+    return value
+
+
+@pytest.fixture
+def clients(app, student_client, admin_client):
+    return {'anon': app.test_client(), 'student': student_client, 'admin': admin_client}
+
+
+def test_every_route_has_a_budget(app):
+    routes = {
+        (rule.endpoint, method)
+        for rule in app.url_map.iter_rules() if rule.endpoint != 'static'
+        for method in rule.methods - {'HEAD', 'OPTIONS'}
+    }
+    budgeted = {(case.endpoint, case.method) for case in ROUTE_BUDGETS}
+    assert routes - budgeted == set(), 'Rotas sem orçamento de consultas'
+    assert budgeted - routes == set(), 'Orçamentos de rotas que não existem mais'
+
+
+@pytest.mark.parametrize('case', ROUTE_BUDGETS, ids=lambda case: f'{case.method} {case.endpoint}')
+def test_route_query_budget(case, seed, clients, query_recorder):
+    client = clients[case.client]
+    url = fill_ids(case.url, seed)
+    body = fill_ids(case.body, seed)
+    kwargs = {'data': body, 'content_type': 'application/json'} if isinstance(body, str) else {'json': body}
+
+    with query_recorder:
+        response = client.open(url, method=case.method, **kwargs)
+
+    assert response.status_code == case.status, response.get_data(as_text=True)[:500]
+    if case.max_queries is not None:
+        assert query_recorder.count <= case.max_queries, (
+            f'{case.method} {url}: {query_recorder.count} consultas (orçamento {case.max_queries})\n'
+            f'{query_recorder.report()}'
+        )
+    if case.max_rows is not None:
+        assert query_recorder.rows <= case.max_rows, (
+            f'{case.method} {url}: {query_recorder.rows} linhas lidas (orçamento {case.max_rows})'
+        )
@@ -0,0 +1,68 @@
+"""
+Réplica de leitura com dois arquivos SQLite: rotas @read_only leem da réplica, exceto logo
+depois de uma escrita do mesmo usuário (REPLICA_STICKY_SECONDS).
+"""
+import os
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+
+from conftest import app_module, logged_client
+
+
+@pytest.fixture
+def replica(app, seed):
+    """Cópia do primário registrada como bind 'replica' (como no GUIA_DEPLOY)"""
+    with app.app_context():
+        primary_path = app_module.db.engine.url.database
+        path = os.path.join(os.path.dirname(primary_path), 'replica.db')
+        with sqlite3.connect(primary_path) as source, sqlite3.connect(path) as target:
+            source.backup(target)
+        engine = create_engine(f'sqlite:///{path}')
+        engines = app_module.db.engines
+        engines['replica'] = engine
+    yield engine
+    del engines['replica']
+    engine.dispose()
+    os.remove(path)
+
+
+def folder_names(client):
+    response = client.get('/api/folders')
+    assert response.status_code == 200
+    return {folder['name'] for folder in response.get_json()}
+
+
+def test_reads_use_replica_except_right_after_a_write(student_client, seed, replica):
+    with replica.begin() as conn:
+        conn.exec_driver_sql("UPDATE folder SET name = 'Só na réplica' WHERE id = ?", (seed['folder_id'],))
+    assert 'Só na réplica' in folder_names(student_client)
+
+    assert student_client.post('/api/folders', json={'name': 'Nova'}).status_code == 201
+    names = folder_names(student_client)
+    assert 'Nova' in names and 'Só na réplica' not in names
+
+    # Passada a janela de read-your-writes, volta para a réplica (que não recebeu a escrita)
+    with student_client.session_transaction() as sess:
+        sess['last_write_at'] -= app_module.REPLICA_STICKY_SECONDS
+    names = folder_names(student_client)
+    assert 'Nova' not in names and 'Só na réplica' in names
+
+
+def test_user_not_yet_on_replica_reads_from_primary(app, seed, replica):
+    with app.app_context():
+        user = app_module.User(name='Recém', email='recem@teste.com', password_hash='x')
+        app_module.db.session.add(user)
+        app_module.db.session.commit()
+        user_id = user.id
+    client = logged_client(app, user_id, 'Recém', 'recem@teste.com')
+
+    assert client.get('/app').status_code == 200
+    assert client.get('/api/sync?since=0').get_json()['full']
+
+    with app.app_context():
+        app_module.db.session.execute(app_module.db.delete(app_module.User).filter_by(id=user_id))
+        app_module.db.session.commit()
+    assert client.get('/api/sync?since=0').status_code == 404
+    assert client.get('/app').status_code == 302
@@ -0,0 +1,58 @@
+"""
+Notas relacionadas: TF-IDF local por usuário (/api/notes/<id>/related).
+"""
+from conftest import app_module
+
+
+def create_note(client, folder_id, title, content):
+    response = client.post('/api/notes', json={'folder_id': folder_id, 'title': title, 'content': content})
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def test_related_notes_cross_folders(student_client, seed):
+    other_folder = student_client.post('/api/folders', json={'name': 'Revisão'}).get_json()['id']
+    mitose = create_note(student_client, seed['folder_id'], 'Mitose',
+                         'Divisão celular: prófase, metáfase, anáfase e telófase geram células idênticas.')
+    resumo = create_note(student_client, other_folder, 'Resumo de divisão celular',
+                         'Mitose e meiose; na mitose a prófase, metáfase, anáfase e telófase.')
+    create_note(student_client, other_folder, 'Revolução Francesa', 'Queda da Bastilha em 1789 e os jacobinos.')
+
+    related = student_client.get(f'/api/notes/{mitose}/related?k=3').get_json()
+
+    assert related[0]['id'] == resumo
+    assert related[0]['folder_name'] == 'Revisão'
+    assert all(item['id'] != mitose for item in related)
+
+
+def test_only_changed_notes_are_reindexed(app, student_client, seed):
+    student_client.get(f"/api/notes/{seed['note_id']}/related")
+    student_client.put(f"/api/notes/{seed['note_id']}", json={'title': 'Fotossíntese', 'content': 'clorofila'})
+
+    with app.app_context():
+        assert app_module.refresh_note_vectors(seed['student_id']) == 1
+        assert app_module.refresh_note_vectors(seed['student_id']) == 0
+
+
+def test_related_notes_of_another_user(admin_client, seed):
+    response = admin_client.get(f"/api/notes/{seed['note_id']}/related")
+    assert response.status_code == 404
+
+
+def test_concurrent_refresh_does_not_collide(app, seed, monkeypatch):
+    # Outra requisição grava o vetor da nota entre a busca das desatualizadas e o INSERT
+    encode = app_module.encode_note_terms
+
+    def encode_after_concurrent_insert(title, content):
+        app_module.db.session.execute(app_module.db.insert(app_module.NoteVector).values(
+            note_id=seed['note_id'], user_id=seed['student_id'], revision=0, terms=b''
+        ))
+        monkeypatch.setattr(app_module, 'encode_note_terms', encode)
+        return encode(title, content)
+
+    monkeypatch.setattr(app_module, 'encode_note_terms', encode_after_concurrent_insert)
+    with app.app_context():
+        assert app_module.refresh_note_vectors(seed['student_id']) > 0
+        vector = app_module.db.session.get(app_module.NoteVector, seed['note_id'])
+        assert vector.terms != b''
+        assert app_module.refresh_note_vectors(seed['student_id']) == 0
@@ -0,0 +1,42 @@
+"""
+Rotina: dias como máscara de bits e conclusões por data.
+"""
+
+
+def test_task_without_valid_days_is_rejected(student_client, seed):
+    task = {'title': 'Revisar', 'category': 'estudo', 'start_time': '10:00', 'end_time': '11:00'}
+
+    for days in ([], '', ['feriado']):
+        response = student_client.post('/api/routine/tasks', json={**task, 'days': days})
+        assert response.status_code == 400
+
+    response = student_client.put(f"/api/routine/tasks/{seed['task_id']}", json={'days': ['feriado']})
+    assert response.status_code == 400
+    tasks = student_client.get('/api/routine/tasks').get_json()
+    assert next(t for t in tasks if t['id'] == seed['task_id'])['days']
+
+
+def test_completions_do_not_change_sync_revisions(student_client, seed):
+    cursor = student_client.get('/api/sync?since=0').get_json()['cursor']
+
+    student_client.post(f"/api/routine/tasks/{seed['task_id']}/toggle", json={})
+    student_client.post('/api/routine/reset', json={})
+
+    changes = student_client.get(f'/api/sync?since={cursor}').get_json()
+    assert changes['cursor'] == cursor
+    assert changes['routine_tasks'] == []
+
+
+def test_move_with_one_neighbor_lands_next_to_it(student_client, seed):
+    def order():
+        return [t['id'] for t in student_client.get('/api/routine/tasks').get_json()]
+
+    a, b, c, d = order()[:4]
+    student_client.post(f'/api/routine/tasks/{c}/move', json={'after_id': a})
+    assert order()[:4] == [a, c, b, d]
+
+    student_client.post(f'/api/routine/tasks/{a}/move', json={'before_id': d})
+    assert order()[:4] == [c, b, a, d]
+
+    keys = [t['order_index'] for t in student_client.get('/api/routine/tasks').get_json()]
+    assert len(set(keys)) == len(keys)
@@ -0,0 +1,22 @@
+"""
+/api/sync: cursor incremental e retenção dos registros de exclusão.
+"""
+
+
+def test_cursor_older_than_pruned_tombstones_gets_full_sync(app, student_client, seed):
+    def sync(since):
+        return student_client.get(f'/api/sync?since={since}').get_json()
+
+    cursor = sync(0)['cursor']
+    student_client.delete(f"/api/notes/{seed['note_id']}")
+    changes = sync(cursor)
+    assert not changes['full']
+    assert changes['deleted']['notes'] == [seed['note_id']]
+
+    result = app.test_cli_runner().invoke(args=['prune-sync-tombstones', '--days', '0'])
+    assert result.exit_code == 0, result.output
+
+    changes = sync(cursor)
+    assert changes['full']
+    assert seed['note_id'] not in {note['id'] for note in changes['notes']}
+    assert not sync(changes['cursor'])['full']